@@ -0,0 +1,45 @@
+# Error categories shared by the model server (main.py) and the offline
+# session analytics (shot_analytics.py). Kept free of imports and side
+# effects so either can load them without starting the other.
+
+# Define error categories
+ERROR_CATEGORIES = [
+    'frontsight_dip',
+    'overtight_grip',
+    'acute_angle_trigger',
+    'stance_position',
+    'breath_control',
+    'early_recoil'
+]
+
+# Reported instead of a category when the top confidence is below 50%
+UNCERTAIN_CATEGORY = "Uncertain (Low Confidence)"
+
+# Error category information
+ERROR_CATEGORIES_INFO = {
+    'frontsight_dip': {
+        'description': 'Incorrect W formed by dip of front sight',
+        'solution': 'Work on arm oriented exercises.'
+    },
+    'overtight_grip': {
+        'description': 'Extra pressure exercised on the grip',
+        'solution': 'Relax your grip  and hold the gun like giving a handshake.'
+    },
+    'acute_angle_trigger': {
+        'description': 'Rough handling of Trigger',
+        'solution': 'Maintain a 90 degree pace with the index finger and the trigger.'
+    },
+    'stance_position': {
+        'description': 'Improper foot positioning or weight distribution',
+        'solution': 'Maintain athletic stance with feet shoulder-width apart. Weight slightly forward, knees flexed. Fix your feet parallel to each other and stay directed towards the aiming area.'
+    },
+    'breath_control': {
+        'description': 'Irregular breathing pattern',
+        'solution': 'Follow box breathing and practice 4:8 ratio breathing regularly.'
+    },
+    'early_recoil': {
+        'description': 'Pulling the trigger before reaching the target due to anxiety',
+        'solution': 'Calm down and cancel shots if the hand is not stable and take regular breaks when needed.'
+    }
+}
+
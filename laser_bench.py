@@ -0,0 +1,356 @@
+import csv
+import math
+import os
+import sys
+import time
+from collections import defaultdict
+import cv2
+import numpy as np
+
+# Keep pygame's import banner out of --json output
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+from laser_track import LaserDetectionSystem, TARGET_CENTER_X, TARGET_CENTER_Y, ring_score
+
+# Headless replay benchmark for the laser pipeline: feeds recorded or synthetic
+# footage through LaserDetectionSystem.process_frame as fast as possible and
+# reports throughput, per-stage latency and accuracy against ground truth.
+
+# Image types read from a frames directory
+FRAME_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# A detection further than this from the true dot counts as a miss (camera px)
+MATCH_RADIUS = 5.0
+
+# Synthetic footage: dot brightness profile and background
+DOT_SIGMA = 3.5
+NOISE_LEVEL = 40
+RING_GRAY = 110
+
+
+class FrameDirectoryCapture:
+    """VideoCapture stand-in that reads the image files of a directory in name order"""
+    def __init__(self, directory, fps=30.0):
+        self.directory = directory
+        self.fps = fps
+        self.paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                            if name.lower().endswith(FRAME_EXTENSIONS))
+        self.position = 0
+
+    def __str__(self):
+        return self.directory
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        if self.position >= len(self.paths):
+            return False, None
+        frame = cv2.imread(self.paths[self.position])
+        self.position += 1
+        return frame is not None, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            return True
+        return False
+
+    def release(self):
+        self.position = len(self.paths)
+
+
+def truth_path(source):
+    """Default ground-truth file next to a video or inside a frames directory"""
+    if os.path.isdir(source):
+        return os.path.join(source, 'truth.csv')
+    return os.path.splitext(source)[0] + '.truth.csv'
+
+
+def load_truth(path):
+    """Ground truth as (visible bool array, xy float array) indexed by frame"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    visible = np.array([row['visible'] == '1' for row in rows])
+    xy = np.array([[float(row['x'] or 'nan'), float(row['y'] or 'nan')] for row in rows])
+    return visible, xy
+
+
+def synthetic_path(frames, fps, width, height, rng):
+    """
+    Dot positions for a synthetic session: aimed holds that wobble around an
+    aim point and end in a release, occasional short trigger flashes, and
+    gaps with no dot. Returns (visible, xy) per frame in camera pixels.
+    """
+    center = np.array([width / 2, height / 2])
+    radius = min(width, height) // 3
+    visible = np.zeros(frames, dtype=bool)
+    xy = np.full((frames, 2), np.nan)
+    i = int(0.5 * fps)
+    while i < frames:
+        aim = center + rng.uniform(-0.7, 0.7, 2) * radius
+        if rng.random() < 0.25:
+            length = max(1, int(0.1 * fps))
+            wobble = np.zeros((length, 2))
+        else:
+            length = int(rng.uniform(1.0, 2.0) * fps)
+            t = np.arange(length) / fps
+            phase = rng.uniform(0, 2 * np.pi, 2)
+            wobble = (np.cumsum(rng.normal(0, 0.4, (length, 2)), axis=0)
+                      + 3.0 * np.sin(2 * np.pi * 1.3 * t[:, None] + phase))
+        end = min(frames, i + length)
+        visible[i:end] = True
+        xy[i:end] = aim + wobble[:end - i]
+        i = end + int(rng.uniform(0.4, 0.8) * fps)
+    return visible, xy
+
+
+def draw_target_background(width, height):
+    """Printed-target look: dark paper with gray rings at the default calibration"""
+    background = np.full((height, width), 20, dtype=np.uint8)
+    radius = min(width, height) // 3
+    for ring in range(10):
+        cv2.circle(background, (width // 2, height // 2), int(radius * (1 - ring * 0.095)), RING_GRAY, 1,
+                   cv2.LINE_AA)
+    return background
+
+
+def add_dot(gray, x, y, sigma=DOT_SIGMA):
+    """Add a Gaussian laser dot centred at sub-pixel (x, y), touching only its neighbourhood"""
+    reach = int(math.ceil(4 * sigma))
+    x0, x1 = max(0, int(x) - reach), min(gray.shape[1], int(x) + reach + 1)
+    y0, y1 = max(0, int(y) - reach), min(gray.shape[0], int(y) + reach + 1)
+    xs = np.arange(x0, x1, dtype=np.float32)
+    ys = np.arange(y0, y1, dtype=np.float32)[:, None]
+    patch = gray[y0:y1, x0:x1].astype(np.float32)
+    patch += 255.0 * np.exp(-((xs - x) ** 2 + (ys - y) ** 2) / (2 * sigma ** 2))
+    gray[y0:y1, x0:x1] = np.clip(patch, 0, 255).astype(np.uint8)
+
+
+def generate_synthetic(output, frames=900, fps=30.0, width=640, height=480, seed=0):
+    """
+    Write synthetic laser footage with known dot positions: an .avi/.mp4 file,
+    or numbered PNG frames if output has no video extension. Ground truth goes
+    to truth_path(output). Returns the truth file path.
+    """
+    rng = np.random.default_rng(seed)
+    visible, xy = synthetic_path(frames, fps, width, height, rng)
+    background = draw_target_background(width, height)
+    as_video = os.path.splitext(output)[1].lower() in ('.avi', '.mp4', '.mkv')
+    if as_video:
+        fourcc = cv2.VideoWriter_fourcc(*('mp4v' if output.lower().endswith('.mp4') else 'MJPG'))
+        writer = cv2.VideoWriter(output, fourcc, fps, (width, height))
+        if not writer.isOpened():
+            raise Exception(f"Could not open video writer for {output}")
+    else:
+        os.makedirs(output, exist_ok=True)
+
+    for i in range(frames):
+        gray = background + rng.integers(0, NOISE_LEVEL // 4, background.shape, dtype=np.uint8)
+        if visible[i]:
+            add_dot(gray, xy[i, 0], xy[i, 1])
+        frame = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        if as_video:
+            writer.write(frame)
+        else:
+            cv2.imwrite(os.path.join(output, f"frame_{i:06d}.png"), frame)
+    if as_video:
+        writer.release()
+
+    path = truth_path(output)
+    with open(path, 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['frame', 'visible', 'x', 'y'])
+        for i in range(frames):
+            if visible[i]:
+                out.writerow([i, 1, f"{xy[i, 0]:.3f}", f"{xy[i, 1]:.3f}"])
+            else:
+                out.writerow([i, 0, '', ''])
+    print(f"Wrote {frames} frames ({visible.sum()} with a dot) to {output}, ground truth in {path}")
+    return path
+
+
+def expected_shots(visible, xy, fps, system):
+    """
+    Shots the detector should report for the ground truth, as an array of
+    scores, following the same flash/release rules as ShotDetector.
+    """
+    scores = []
+    detector = system.shot_detector
+    gap_frames = max(1, int(math.ceil(detector.release_gap * fps - 1e-9)))
+    i = 0
+    n = len(visible)
+    while i < n:
+        if not visible[i]:
+            i += 1
+            continue
+        start = i
+        while i < n and (visible[i] or (i + 1 < n and visible[i:i + gap_frames].any())):
+            i += 1
+        segment = np.nonzero(visible[start:i])[0] + start
+        # The recording has to outlast the release gap for the shot to register
+        if segment[-1] + gap_frames >= n:
+            break
+        if (segment[-1] - segment[0]) / fps <= detector.flash_max:
+            x, y = xy[segment].mean(axis=0)
+        else:
+            x, y = xy[segment[-1]]
+        tx, ty = system_target(system, x, y)
+        scores.append(ring_score(math.hypot(tx - TARGET_CENTER_X, ty - TARGET_CENTER_Y)))
+    return np.array(scores, dtype=int)
+
+
+def system_target(system, x, y):
+    """Display coordinates of a raw (unmirrored) camera point through the system's calibration"""
+    h = system.homography_coeffs
+    x = system.frame_width - 1 - x
+    w = h[6] * x + h[7] * y + h[8]
+    return (h[0] * x + h[1] * y + h[2]) / w, (h[3] * x + h[4] * y + h[5]) / w
+
+
+def percentiles_ms(samples):
+    values = np.asarray(samples) * 1000
+    return {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)),
+            'p99': float(np.percentile(values, 99)), 'max': float(values.max())}
+
+
+def run_benchmark(source, truth=None, fps=None, detection_mode=None, subpixel=None, max_frames=None):
+    """
+    Replay a video file or frames directory through a headless
+    LaserDetectionSystem as fast as possible. Returns a report dict with
+    throughput, per-stage latency percentiles (ms) and, given ground truth,
+    detection and scoring accuracy.
+    """
+    system = LaserDetectionSystem(FrameDirectoryCapture(source, fps or 30.0) if os.path.isdir(source) else source,
+                                  headless=True)
+    cap = system.cap
+    if detection_mode is not None:
+        system.detection_mode = detection_mode
+    if subpixel is not None:
+        system.subpixel = subpixel
+    fps = fps or cap.get(cv2.CAP_PROP_FPS) or 30.0
+    # The constructor reads a frame to size the system; replay from the start
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    system.stage_times = defaultdict(list)
+    read_times = []
+    detections = []
+    shot_scores = []
+    frame_index = 0
+    start = time.perf_counter()
+    while max_frames is None or frame_index < max_frames:
+        read_start = time.perf_counter()
+        ret, frame = cap.read()
+        capture_time = time.perf_counter()
+        if not ret:
+            break
+        read_times.append(capture_time - read_start)
+        shot = system.process_frame(frame, capture_time, frame_index / fps)
+        if shot is not None:
+            shot_scores.append(system.score)
+        detections.append(system.last_detection if system.laser_detected else None)
+        frame_index += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+    if frame_index == 0:
+        raise Exception(f"No frames could be read from {source}")
+
+    stages = {'read': percentiles_ms(read_times)}
+    stages.update({name: percentiles_ms(times) for name, times in system.stage_times.items()})
+    pipeline = np.sum([system.stage_times[name] for name in system.stage_times], axis=0)
+    report = {
+        'source': str(source),
+        'frames': frame_index,
+        'seconds': elapsed,
+        'fps': frame_index / elapsed,
+        'pipeline_fps': frame_index / pipeline.sum(),
+        'stages': stages,
+        'shots': len(shot_scores)
+    }
+
+    truth = truth or truth_path(source)
+    if os.path.exists(truth):
+        visible, xy = load_truth(truth)
+        visible, xy = visible[:frame_index], xy[:frame_index]
+        detected = np.array([d is not None for d in detections[:len(visible)]])
+        errors = []
+        hits = 0
+        for i in np.nonzero(visible & detected)[0]:
+            # Detections are in the mirrored frame
+            dx = detections[i][0] - (system.frame_width - 1 - xy[i, 0])
+            dy = detections[i][1] - xy[i, 1]
+            error = math.hypot(dx, dy)
+            if error <= MATCH_RADIUS:
+                hits += 1
+                errors.append(error)
+        expected = expected_shots(visible, xy, fps, system)
+        matched = min(len(expected), len(shot_scores))
+        report['accuracy'] = {
+            'truth': truth,
+            'recall': hits / max(1, int(visible.sum())),
+            'false_positive_rate': float((detected & ~visible).sum()) / max(1, int((~visible).sum())),
+            'mean_error_px': float(np.mean(errors)) if errors else float('nan'),
+            'p95_error_px': float(np.percentile(errors, 95)) if errors else float('nan'),
+            'expected_shots': len(expected),
+            'score_agreement': (float(np.mean(expected[:matched] == np.array(shot_scores[:matched])))
+                                if matched else float('nan'))
+        }
+    return report
+
+
+def print_report(report):
+    print(f"Replayed {report['frames']} frames from {report['source']} in {report['seconds']:.2f}s: "
+          f"{report['fps']:.1f} fps end to end, {report['pipeline_fps']:.1f} fps excluding decode")
+    print(f"{'stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in report['stages'].items():
+        print(f"{name:<10}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}{stats['max']:>10.3f}")
+    accuracy = report.get('accuracy')
+    if accuracy is None:
+        print(f"Shots: {report['shots']} (no ground truth)")
+        return
+    print(f"Detection recall {accuracy['recall']:.1%}, false positives {accuracy['false_positive_rate']:.1%}, "
+          f"error mean {accuracy['mean_error_px']:.3f} px / p95 {accuracy['p95_error_px']:.3f} px")
+    print(f"Shots: {report['shots']} detected, {accuracy['expected_shots']} expected, "
+          f"score agreement {accuracy['score_agreement']:.1%}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Headless replay benchmark for the laser pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="Write synthetic footage with ground truth")
+    generate.add_argument('output', help="Video file (.avi/.mp4) or directory for PNG frames")
+    generate.add_argument('--frames', type=int, default=900)
+    generate.add_argument('--fps', type=float, default=30.0)
+    generate.add_argument('--width', type=int, default=640)
+    generate.add_argument('--height', type=int, default=480)
+    generate.add_argument('--seed', type=int, default=0)
+
+    run = commands.add_parser('run', help="Replay footage and report speed and accuracy")
+    run.add_argument('source', help="Video file or directory of frames")
+    run.add_argument('--truth', help="Ground-truth CSV (default: next to the source)")
+    run.add_argument('--fps', type=float, help="Frame rate for shot timing (default: from the source)")
+    run.add_argument('--mode', choices=['roi', 'full'], help="Detection mode to benchmark")
+    run.add_argument('--no-subpixel', action='store_true', help="Use integer contour centroids")
+    run.add_argument('--max-frames', type=int)
+    run.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        generate_synthetic(args.output, args.frames, args.fps, args.width, args.height, args.seed)
+    else:
+        report = run_benchmark(args.source, args.truth, args.fps, args.mode,
+                               False if args.no_subpixel else None, args.max_frames)
+        if args.json:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            print_report(report)
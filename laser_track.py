@@ -1,7 +1,12 @@
 import cv2
 import numpy as np
 import math
+import os
+import json
 import time
+import threading
+import contextlib
+from collections import deque
 import pygame
 from pygame import gfxdraw
 
@@ -30,32 +35,497 @@ YELLOW = (255, 255, 0)
 GRAY = (128, 128, 128)
 BLUE = (0, 0, 255)
 
-# LED status
+# Initial LED status (each LaserDetectionSystem keeps its own copy)
 led_status = {
     'red': False,
     'yellow': False,
     'green': False
 }
 
+# LED indicator layout
+LED_POSITIONS = {
+    'red': (50, 50),
+    'yellow': (50, 100),
+    'green': (50, 150)
+}
+LED_LABELS = {
+    'red': "Outside Target",
+    'yellow': "Near Center",
+    'green': "Center Hit"
+}
+LED_COLORS = {
+    'red': RED,
+    'yellow': YELLOW,
+    'green': GREEN
+}
+
+INSTRUCTIONS = "Press 'C' to toggle camera view, 'E' to export shots, 'K' to calibrate, 'R' to toggle render cache, 'ESC' to exit"
+
+# Shot event kinds
+SHOT_FLASH = 0    # Short laser pulse fired on the trigger
+SHOT_RELEASE = 1  # Dot held on target, shot taken when it goes out
+
+SHOT_DTYPE = np.dtype([
+    ('time', 'f8'),       # perf_counter() seconds; ShotStore.clock_offset converts to epoch time
+    ('x', 'f4'),          # Offset from target center in display pixels
+    ('y', 'f4'),
+    ('score', 'i1'),
+    ('kind', 'i1'),
+    ('duration', 'f4'),   # How long the dot was visible
+    ('trace_len', 'i2')
+])
+
+# Aim trace kept before each shot (seconds), and how many samples that takes:
+# at least TRACE_MIN_FPS is assumed, with TRACE_HEADROOM for faster cameras
+TRACE_WINDOW = 1.0
+TRACE_MIN_FPS = 120
+TRACE_HEADROOM = 1.25
+
+# Arduino LED output
+ARDUINO_PORT = os.environ.get('SNYPTER_ARDUINO_PORT', '/dev/ttyACM0')
+ARDUINO_BAUD = 9600
+
+# Saved target calibrations (camera -> display homographies), keyed by camera ID
+CALIBRATION_FILE = os.environ.get('SNYPTER_CALIBRATION_FILE', 'calibration.json')
+
+
+def ring_score(distance):
+    """ISSF ring for a distance from the target center in display pixels (0 = miss)"""
+    if distance > TARGET_RADIUS:
+        return 0
+    if distance <= BULL_RADIUS:
+        return 10
+    return max(1, 10 - int(distance / RING_WIDTH))
+
+
+def trace_samples_for(trace_window, fps):
+    """
+    Aim samples needed to hold trace_window seconds at fps. Cameras often
+    report 30 fps whatever they deliver, so at least TRACE_MIN_FPS is
+    assumed, with TRACE_HEADROOM on top.
+    """
+    return int(math.ceil(trace_window * max(fps, TRACE_MIN_FPS) * TRACE_HEADROOM))
+
+
+class AimTrace:
+    """Fixed-size ring of recent (time, x, y) aim samples"""
+    def __init__(self, capacity=512):
+        self.samples = np.zeros((capacity, 3), dtype=np.float64)
+        self.capacity = capacity
+        self.count = 0
+
+    def append(self, t, x, y):
+        self.samples[self.count % self.capacity] = (t, x, y)
+        self.count += 1
+
+    def window(self, start, end):
+        """Samples with start <= time <= end, oldest first"""
+        n = min(self.count, self.capacity)
+        first = self.count - n
+        ordered = self.samples[np.arange(first, self.count) % self.capacity]
+        mask = (ordered[:, 0] >= start) & (ordered[:, 0] <= end)
+        return ordered[mask]
+
+
+class ShotStore:
+    """
+    Append-only shot log in preallocated NumPy arrays. Each shot keeps up to
+    trace_samples aim samples (time relative to the shot, x, y); size it
+    with trace_samples_for() so a whole trace window fits, as longer traces
+    lose their oldest samples. Once capacity is reached the oldest shots are
+    overwritten, so memory stays bounded however long the session runs.
+    """
+    def __init__(self, capacity=10000, trace_samples=trace_samples_for(TRACE_WINDOW, TRACE_MIN_FPS)):
+        self.capacity = capacity
+        self.trace_samples = trace_samples
+        self.truncated = 0
+        self.shots = np.zeros(capacity, dtype=SHOT_DTYPE)
+        self.traces = np.zeros((capacity, trace_samples, 3), dtype=np.float32)
+        self.count = 0
+        self.clock_offset = time.time() - time.perf_counter()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, shot_time, x, y, score, kind, duration, trace):
+        """Record one shot; trace is an (n, 3) array of absolute (time, x, y) samples"""
+        i = self.count % self.capacity
+        if len(trace) > self.trace_samples:
+            if self.truncated == 0:
+                print(f"Aim traces are longer than {self.trace_samples} samples and lose their oldest part; "
+                      f"build the ShotStore with a larger trace_samples for this frame rate")
+            self.truncated += 1
+            trace = trace[-self.trace_samples:]
+        n = len(trace)
+        self.shots[i] = (shot_time, x, y, score, kind, duration, n)
+        self.traces[i, :n, 0] = trace[:, 0] - shot_time
+        self.traces[i, :n, 1:] = trace[:, 1:]
+        self.traces[i, n:] = 0
+        self.count += 1
+        return self.shots[i]
+
+    def ordered(self):
+        """(shots, traces) copies in chronological order"""
+        n = len(self)
+        order = np.arange(self.count - n, self.count) % self.capacity
+        return self.shots[order], self.traces[order]
+
+    def export(self, path):
+        """Write the session to a compressed .npz for offline analysis"""
+        shots, traces = self.ordered()
+        np.savez_compressed(path, shots=shots, traces=traces, clock_offset=self.clock_offset)
+        return path
+
+
+class ShotDetector:
+    """
+    Turns per-frame laser detections into discrete shots.
+    The dot appearing starts a hold (onset); once it has been gone for
+    release_gap seconds the hold ends. Holds no longer than flash_max are
+    treated as a trigger flash (shot at onset, mean position of the flash),
+    longer ones as a release (shot at the last seen position). Each shot
+    carries the aim samples from the trace_window seconds before it.
+    """
+    IDLE = 'idle'
+    HOLD = 'hold'
+
+    def __init__(self, flash_max=0.15, release_gap=0.1, trace_window=TRACE_WINDOW, trace_capacity=512):
+        self.flash_max = flash_max
+        self.release_gap = release_gap
+        self.trace_window = trace_window
+        self.trace = AimTrace(trace_capacity)
+        self.state = self.IDLE
+        self.onset_time = 0.0
+        self.last_seen = 0.0
+        self.last_x = 0.0
+        self.last_y = 0.0
+
+    def update(self, t, detected, x=None, y=None):
+        """Feed one frame; returns a shot dict when a shot completes, else None"""
+        if detected:
+            self.trace.append(t, x, y)
+            if self.state == self.IDLE:
+                self.state = self.HOLD
+                self.onset_time = t
+            self.last_seen = t
+            self.last_x, self.last_y = x, y
+            return None
+
+        if self.state != self.HOLD or t - self.last_seen < self.release_gap:
+            return None
+
+        self.state = self.IDLE
+        duration = self.last_seen - self.onset_time
+        if duration <= self.flash_max:
+            kind = SHOT_FLASH
+            shot_time = self.onset_time
+            flash = self.trace.window(self.onset_time, self.last_seen)
+            shot_x, shot_y = flash[:, 1].mean(), flash[:, 2].mean()
+            trace = self.trace.window(shot_time - self.trace_window, self.last_seen)
+        else:
+            kind = SHOT_RELEASE
+            shot_time = self.last_seen
+            shot_x, shot_y = self.last_x, self.last_y
+            trace = self.trace.window(shot_time - self.trace_window, shot_time)
+        return {
+            'time': shot_time,
+            'x': float(shot_x),
+            'y': float(shot_y),
+            'kind': kind,
+            'duration': duration,
+            'trace': trace
+        }
+
+
+def contour_centroid(contour):
+    """Centroid of a binary contour from its moments, or None for a degenerate contour"""
+    M = cv2.moments(contour)
+    if M["m00"] == 0:
+        return None
+    return M["m10"] / M["m00"], M["m01"] / M["m00"]
+
+
+# Constant images to subtract thresholds with, grown to the largest region seen
+_threshold_planes = {}
+
+
+def threshold_levels(gray, threshold):
+    """
+    Brightness above the threshold, zero elsewhere (a saturating subtract).
+    Its non-zero pixels are exactly the binary threshold mask, so the same
+    image serves both the contour search and weighted_centroid. Subtracting
+    a cached constant image runs as fast as cv2.threshold; a scalar operand
+    costs twice that.
+    """
+    height, width = gray.shape
+    plane = _threshold_planes.get(threshold)
+    if plane is None or plane.shape[0] < height or plane.shape[1] < width:
+        shape = (height, width) if plane is None else (max(height, plane.shape[0]), max(width, plane.shape[1]))
+        plane = _threshold_planes[threshold] = np.full(shape, threshold, dtype=np.uint8)
+    return cv2.subtract(gray, plane[:height, :width])
+
+
+def weighted_centroid(levels, contour):
+    """
+    Sub-pixel centroid of a laser blob: pixels in the contour's bounding box
+    are weighted by how far their brightness exceeds the threshold (levels
+    from threshold_levels), so the estimate follows the intensity peak
+    rather than the binary outline. Returns float (x, y) in levels'
+    coordinates, or None.
+    """
+    x, y, w, h = cv2.boundingRect(contour)
+    # Raster moments of the view are the weighted sums in one pass, no copy
+    M = cv2.moments(levels[y:y + h, x:x + w])
+    if M["m00"] == 0:
+        return None
+    return x + M["m10"] / M["m00"], y + M["m01"] / M["m00"]
+
+
+def find_target_ellipse(frame, min_size=0.1):
+    """
+    Find the target in a camera frame. Returns (ellipse, center): the outer
+    ring as a cv2 ellipse ((cx, cy), (width, height), angle) and the camera
+    position of the target center, or None if no target was found.
+    Ring edges are fitted with ellipses so a tilted camera is handled; the
+    largest one sharing its center with another ring is taken as the outer
+    ring. Under perspective the ring centers drift with ring size, so the
+    target center is extrapolated from all concentric rings to size zero.
+    Falls back to Hough circles when no ellipse fits.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    min_axis = min(gray.shape) * min_size
+    edges = cv2.Canny(gray, 50, 150)
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+    
+    ellipses = []
+    for contour in contours:
+        if len(contour) < 20:
+            continue
+        ellipse = cv2.fitEllipse(contour)
+        (_, _), (width, height), _ = ellipse
+        if min(width, height) < min_axis:
+            continue
+        # Reject edges that are not closed, roughly elliptical outlines
+        hull_area = cv2.contourArea(cv2.convexHull(contour))
+        if not 0.9 <= hull_area / (math.pi * width * height / 4) <= 1.1:
+            continue
+        ellipses.append(ellipse)
+    
+    if ellipses:
+        ellipses.sort(key=lambda e: e[1][0] * e[1][1], reverse=True)
+        for ellipse in ellipses:
+            (cx, cy), size, _ = ellipse
+            tolerance = 0.05 * max(size)
+            rings = [other for other in ellipses if math.hypot(other[0][0] - cx, other[0][1] - cy) <= tolerance]
+            if len(rings) > 1:
+                break
+        else:
+            return ellipses[0], ellipses[0][0]
+        # Center offset grows with the square of the ring size; fit that and take the intercept
+        area = np.array([ring[1][0] * ring[1][1] for ring in rings])
+        centers = np.array([ring[0] for ring in rings])
+        if np.ptp(area) < 1e-6:
+            return ellipse, (cx, cy)
+        fit = np.polyfit(area, centers, 1)
+        return ellipse, (float(fit[1][0]), float(fit[1][1]))
+    
+    circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp=1.5, minDist=min(gray.shape) // 4,
+                               param1=150, param2=60, minRadius=int(min_axis / 2))
+    if circles is None:
+        return None
+    x, y, r = max(circles[0], key=lambda c: c[2])
+    return ((float(x), float(y)), (2.0 * r, 2.0 * r), 0.0), (float(x), float(y))
+
+
+def ellipse_homography(ellipse, center=None):
+    """
+    3x3 homography taking camera pixels to display pixels that maps the
+    outer ring ellipse onto the on-screen target (TARGET_RADIUS around the
+    target center) and, if given, the camera target center exactly onto
+    the display center. The ellipse axes keep their direction, so the
+    camera's "up" stays up on screen.
+    """
+    (cx, cy), (width, height), angle = ellipse
+    t = math.radians(angle)
+    axes = [(math.cos(t), math.sin(t), width / 2), (-math.sin(t), math.cos(t), height / 2)]
+    src, dst = [], []
+    for ux, uy, half in axes:
+        for sign in (1, -1):
+            src.append((cx + sign * half * ux, cy + sign * half * uy))
+            dst.append((TARGET_CENTER_X + sign * TARGET_RADIUS * ux, TARGET_CENTER_Y + sign * TARGET_RADIUS * uy))
+    homography = cv2.getPerspectiveTransform(np.float32(src), np.float32(dst))
+    if center is not None:
+        mapped = cv2.perspectiveTransform(np.array([[center]], dtype=np.float64), homography)[0, 0]
+        shift = np.array([[1, 0, TARGET_CENTER_X - mapped[0]], [0, 1, TARGET_CENTER_Y - mapped[1]], [0, 0, 1]])
+        homography = shift @ homography
+    return homography
+
+
+def scale_homography(center_x, center_y, radius):
+    """Homography for an untilted target of the given camera center and radius"""
+    scale = TARGET_RADIUS / radius
+    return np.array([[scale, 0, TARGET_CENTER_X - scale * center_x],
+                     [0, scale, TARGET_CENTER_Y - scale * center_y],
+                     [0, 0, 1]], dtype=np.float64)
+
+
+def load_calibration(camera_id, path=CALIBRATION_FILE):
+    """Saved homography for a camera, or None"""
+    try:
+        with open(path) as f:
+            entry = json.load(f).get(camera_id)
+    except (OSError, ValueError):
+        return None
+    return None if entry is None else np.array(entry['homography'], dtype=np.float64)
+
+
+_calibration_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def calibration_file_lock(path):
+    """
+    Hold the writer lock of a calibration file: a thread lock plus, where
+    fcntl exists, an exclusive lock on path + '.lock' so lanes running as
+    separate processes take turns too.
+    """
+    with _calibration_lock:
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_calibration(camera_id, homography, path=CALIBRATION_FILE):
+    """
+    Store a camera's homography alongside the other saved calibrations.
+    The read-modify-write runs under calibration_file_lock, and the new
+    file replaces the old one atomically, so concurrent lanes keep each
+    other's entries and readers never see a half-written file.
+    """
+    with calibration_file_lock(path):
+        try:
+            with open(path) as f:
+                calibrations = json.load(f)
+        except (OSError, ValueError):
+            calibrations = {}
+        calibrations[camera_id] = {
+            'homography': np.asarray(homography, dtype=np.float64).tolist(),
+            'saved': time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(calibrations, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+class RateMeter:
+    """Smoothed events-per-second counter for the HUD"""
+    def __init__(self, smoothing=0.9):
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self.last_time = None
+
+    def tick(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.last_time is not None and now > self.last_time:
+            instant = 1.0 / (now - self.last_time)
+            self.rate = instant if self.rate == 0.0 else self.smoothing * self.rate + (1 - self.smoothing) * instant
+        self.last_time = now
+
+
+class CameraCapture:
+    """
+    Reads frames on a background thread into a small ring buffer so a slow
+    render never stalls capture. latest() always hands back the newest frame
+    and its capture timestamp; frames that were overwritten before being
+    processed are counted as dropped.
+    """
+    def __init__(self, cap, buffer_size=3):
+        self.cap = cap
+        # Keep the driver from queueing stale frames on its side as well
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.frames = deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.last_sequence = 0
+        self.frames_dropped = 0
+        self.failed = False
+        self.running = False
+        self.rate = RateMeter()
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='camera-capture', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def _run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            timestamp = time.perf_counter()
+            with self.condition:
+                if not ret:
+                    self.failed = True
+                    self.condition.notify_all()
+                    return
+                self.sequence += 1
+                self.frames.append((frame, timestamp, self.sequence))
+                self.rate.tick(timestamp)
+                self.condition.notify_all()
+
+    def latest(self, timeout=1.0):
+        """Wait for a frame newer than the last one returned; (None, None) if capture failed"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.failed or self.sequence > self.last_sequence, timeout):
+                return None, None
+            if not self.frames or self.sequence == self.last_sequence:
+                return None, None
+            frame, timestamp, sequence = self.frames[-1]
+            self.frames_dropped += sequence - self.last_sequence - 1
+            self.last_sequence = sequence
+            return frame, timestamp
+
+
 class LaserDetectionSystem:
-    def __init__(self):
-        # Initialize camera
-        self.cap = cv2.VideoCapture(0)  # Use default camera (change index if needed)
+    def __init__(self, source=0, headless=False, calibrate=False):
+        # Initialize camera (device index or video file)
+        self.source = source
+        # Anything with the VideoCapture read()/get() interface can stand in for a camera
+        self.cap = source if hasattr(source, 'read') else cv2.VideoCapture(source)
         if not self.cap.isOpened():
-            raise Exception("Could not open camera")
+            raise Exception(f"Could not open camera {source}")
         
         # Get camera frame dimensions
-        _, frame = self.cap.read()
+        ret, frame = self.cap.read()
+        if not ret:
+            raise Exception(f"Could not read a frame from camera {source}")
         self.frame_height, self.frame_width = frame.shape[:2]
         
-        # Initialize pygame for visualization
-        pygame.init()
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Laser Target Detection System")
-        
-        # Setup font
-        self.font = pygame.font.SysFont('Arial', 24)
-        self.small_font = pygame.font.SysFont('Arial', 16)
+        # Headless systems only detect and score; they never touch pygame
+        self.headless = headless
+        if not headless:
+            # Initialize pygame for visualization
+            pygame.init()
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pygame.display.set_caption("Laser Target Detection System")
+            
+            # Setup font
+            self.font = pygame.font.SysFont('Arial', 24)
+            self.small_font = pygame.font.SysFont('Arial', 16)
         
         # Initialize variables
         self.laser_x = 0
@@ -67,19 +537,101 @@ class LaserDetectionSystem:
         self.show_hit = False
         self.error_message = ""
         self.error_time = 0
+        self.led_status = dict(led_status)
+        self.led_channel = None  # Optional LedChannel mirroring led_status to hardware
+        self.mirror_buffer = None
         
-        # Target calibration
-        self.cam_target_center_x = self.frame_width // 2
-        self.cam_target_center_y = self.frame_height // 2
-        self.cam_target_radius = min(self.frame_width, self.frame_height) // 3
+        # Target calibration: a homography from camera to display pixels, saved per camera.
+        # Without one the target is assumed untilted at the frame center.
+        self.camera_id = f"{source}@{self.frame_width}x{self.frame_height}"
+        homography = load_calibration(self.camera_id)
+        if homography is None:
+            homography = scale_homography(self.frame_width // 2, self.frame_height // 2,
+                                          min(self.frame_width, self.frame_height) // 3)
+        self.set_homography(homography)
+        if calibrate:
+            self.calibrate(cv2.flip(frame, 1))
         
         # Detection parameters
         self.laser_threshold = 220  # Brightness threshold for laser detection (0-255)
         self.min_laser_area = 5     # Minimum area for laser dot detection
+        self.detection_mode = 'roi' # 'roi' searches around the calibrated target, 'full' the whole frame
+        self.roi_margin = 1.25      # ROI half-size as a multiple of cam_target_radius
+        self.track_window = 40      # Half-size of the window searched around the last detected dot
+        self.coarse_scale = 1       # >1 finds candidates on a max-pooled image downscaled by this factor
+        self.subpixel = True        # Brightness-weighted float centroid instead of integer contour moments
+        self.last_detection = None
         
         # Running control
         self.running = True
         self.show_camera = True
+        
+        # Capture runs on its own thread; detection and display rates are tracked separately
+        self.capture = CameraCapture(self.cap)
+        self.detect_rate = RateMeter()
+        self.display_rate = RateMeter()
+        self.frame_latency = 0.0
+        
+        # Discrete shots and their aim traces, sized to hold a full trace window at the capture rate
+        trace_samples = trace_samples_for(TRACE_WINDOW, self.cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        self.shot_detector = ShotDetector(trace_capacity=max(512, trace_samples))
+        self.shots = ShotStore(trace_samples=trace_samples)
+        
+        # Static layers are pre-rendered once; only dynamic elements are redrawn per frame
+        self.cached_render = True
+        self.render_ms = 0.0
+        
+        # Camera preview is refreshed at most every preview_interval seconds
+        self.preview_interval = 1 / 15
+        self.last_preview_time = 0.0
+        
+        # Per-stage timings of process_frame, recorded only when set to a defaultdict(list)
+        self.stage_times = None
+        
+        if not headless:
+            self.build_render_cache()
+            self.setup_preview()
+    
+    def set_homography(self, homography):
+        """
+        Install a camera -> display homography and derive everything that
+        depends on it (search region, preview overlay) once, so mapping a
+        detection is a single 3x3 multiply.
+        """
+        self.homography = np.asarray(homography, dtype=np.float64)
+        # Plain floats are faster than numpy for one point per frame
+        self.homography_coeffs = tuple(float(v) for v in self.homography.ravel())
+        inverse = np.linalg.inv(self.homography)
+        
+        # Outer and bull rings projected into the camera frame
+        angles = np.linspace(0, 2 * np.pi, 64, endpoint=False)
+        unit = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        self.cam_rings = []
+        for radius in (TARGET_RADIUS, BULL_RADIUS):
+            points = np.array([TARGET_CENTER_X, TARGET_CENTER_Y]) + radius * unit
+            self.cam_rings.append(cv2.perspectiveTransform(points[None], inverse)[0])
+        
+        center = cv2.perspectiveTransform(np.array([[[TARGET_CENTER_X, TARGET_CENTER_Y]]], dtype=np.float64), inverse)
+        self.cam_target_center_x, self.cam_target_center_y = (int(round(v)) for v in center[0, 0])
+        offsets = self.cam_rings[0] - center[0, 0]
+        self.cam_target_radius = int(math.ceil(np.hypot(offsets[:, 0], offsets[:, 1]).max()))
+        self.last_detection = None
+    
+    def calibrate(self, frame, save=True):
+        """Find the target rings in a (mirrored) camera frame and calibrate to them"""
+        found = find_target_ellipse(frame)
+        if found is None:
+            self.error_message = "Calibration failed: target not found"
+            self.error_time = time.time()
+            print(self.error_message)
+            return False
+        homography = ellipse_homography(*found)
+        self.set_homography(homography)
+        if save:
+            save_calibration(self.camera_id, homography)
+        print(f"Calibrated {self.camera_id}: target at ({self.cam_target_center_x}, {self.cam_target_center_y}), "
+              f"radius {self.cam_target_radius}px")
+        return True
     
     def calculate_distance(self, x1, y1, x2, y2):
         """Calculate distance between two points"""
@@ -87,14 +639,18 @@ class LaserDetectionSystem:
     
     def set_leds(self, red, yellow, green):
         """Set LED states"""
-        led_status['red'] = red
-        led_status['yellow'] = yellow
-        led_status['green'] = green
+        self.led_status['red'] = red
+        self.led_status['yellow'] = yellow
+        self.led_status['green'] = green
+        if self.led_channel is not None:
+            self.led_channel.set(red, yellow, green)
     
-    def draw_target(self):
-        """Draw the target on screen"""
+    def draw_target(self, surface=None):
+        """Draw the target on screen (or onto the given surface)"""
+        surface = self.screen if surface is None else surface
+        
         # Fill background
-        self.screen.fill(BLACK)
+        surface.fill(BLACK)
         
         # Draw target rings from outside to inside
         for i in range(1, 11):
@@ -106,85 +662,151 @@ class LaserDetectionSystem:
                 color = RED
             
             # Draw the ring
-            pygame.gfxdraw.aacircle(self.screen, TARGET_CENTER_X, TARGET_CENTER_Y, radius, color)
+            pygame.gfxdraw.aacircle(surface, TARGET_CENTER_X, TARGET_CENTER_Y, radius, color)
             
             # Draw the ring number
             text = self.small_font.render(str(i), True, WHITE)
             text_rect = text.get_rect(center=(TARGET_CENTER_X + radius - 10, TARGET_CENTER_Y - 10))
-            self.screen.blit(text, text_rect)
+            surface.blit(text, text_rect)
         
         # Mark the center with a small dot
-        pygame.gfxdraw.filled_circle(self.screen, TARGET_CENTER_X, TARGET_CENTER_Y, 2, WHITE)
-    
-    def draw_leds(self):
-        """Draw LED indicators on screen"""
-        # LED positions
-        led_positions = {
-            'red': (50, 50),
-            'yellow': (50, 100),
-            'green': (50, 150)
-        }
-        
-        # LED labels
-        led_labels = {
-            'red': "Outside Target",
-            'yellow': "Near Center",
-            'green': "Center Hit"
-        }
+        pygame.gfxdraw.filled_circle(surface, TARGET_CENTER_X, TARGET_CENTER_Y, 2, WHITE)
+    
+    def draw_leds(self, surface=None, states=None):
+        """Draw LED indicators on screen (or onto the given surface with the given states)"""
+        surface = self.screen if surface is None else surface
+        states = self.led_status if states is None else states
         
         # Draw LEDs
-        for led, pos in led_positions.items():
+        for led, pos in LED_POSITIONS.items():
             color = GRAY  # Off state
-            if led_status[led]:
-                if led == 'red':
-                    color = RED
-                elif led == 'yellow':
-                    color = YELLOW
-                elif led == 'green':
-                    color = GREEN
+            if states[led]:
+                color = LED_COLORS[led]
             
             # Draw LED circle
-            pygame.gfxdraw.filled_circle(self.screen, pos[0], pos[1], 15, color)
-            pygame.gfxdraw.aacircle(self.screen, pos[0], pos[1], 15, WHITE)
+            pygame.gfxdraw.filled_circle(surface, pos[0], pos[1], 15, color)
+            pygame.gfxdraw.aacircle(surface, pos[0], pos[1], 15, WHITE)
             
             # Draw LED label
-            label = self.small_font.render(led_labels[led], True, WHITE)
-            self.screen.blit(label, (pos[0] + 25, pos[1] - 8))
+            label = self.small_font.render(LED_LABELS[led], True, WHITE)
+            surface.blit(label, (pos[0] + 25, pos[1] - 8))
+    
+    def hud_items(self):
+        """Dynamic HUD text as (key, text, font, color, position)"""
+        status = "DETECTED" if self.laser_detected else "NOT DETECTED"
+        items = [
+            # Score of the last shot
+            ('score', f"Score: {self.score}", self.font, WHITE, (SCREEN_WIDTH - 150, 20)),
+            ('shots', f"Shots: {self.shots.count}", self.small_font, WHITE, (SCREEN_WIDTH - 150, 100)),
+            # Laser status
+            ('laser', f"Laser: {status}", self.font, GREEN if self.laser_detected else RED, (SCREEN_WIDTH - 250, 60)),
+            # Pipeline rates
+            ('rates', f"Capture {self.capture.rate.rate:.1f} fps | Detect {self.detect_rate.rate:.1f} fps | "
+                      f"Display {self.display_rate.rate:.1f} fps | Lag {self.frame_latency * 1000:.0f} ms | "
+                      f"Dropped {self.capture.frames_dropped} | Render {self.render_ms:.2f} ms "
+                      f"({'cached' if self.cached_render else 'full'})",
+             self.small_font, GRAY, (20, SCREEN_HEIGHT - 55))
+        ]
+        
+        # Error message if active
+        if time.time() - self.error_time < 3:  # Show for 3 seconds
+            items.append(('error', self.error_message, self.font, RED, (SCREEN_WIDTH // 2 - 150, 20)))
+        return items
     
     def display_info(self):
         """Display information on screen"""
-        # Show current score
-        score_text = self.font.render(f"Score: {self.score}", True, WHITE)
-        self.screen.blit(score_text, (SCREEN_WIDTH - 150, 20))
-        
-        # Show laser status
-        status = "DETECTED" if self.laser_detected else "NOT DETECTED"
-        status_color = GREEN if self.laser_detected else RED
-        laser_text = self.font.render(f"Laser: {status}", True, status_color)
-        self.screen.blit(laser_text, (SCREEN_WIDTH - 250, 60))
+        for _, text, font, color, pos in self.hud_items():
+            self.screen.blit(font.render(text, True, color), pos)
         
         # Show instructions
-        instr_text = self.small_font.render("Press 'C' to toggle camera view, 'ESC' to exit", True, WHITE)
-        self.screen.blit(instr_text, (SCREEN_WIDTH // 2 - 180, SCREEN_HEIGHT - 30))
-        
-        # Show error message if active
-        if time.time() - self.error_time < 3:  # Show for 3 seconds
-            error_surf = self.font.render(self.error_message, True, RED)
-            self.screen.blit(error_surf, (SCREEN_WIDTH // 2 - 150, 20))
+        instr_text = self.small_font.render(INSTRUCTIONS, True, WHITE)
+        self.screen.blit(instr_text, (SCREEN_WIDTH // 2 - 220, SCREEN_HEIGHT - 30))
     
-    def detect_laser(self, frame):
+    def build_render_cache(self):
         """
-        Detect laser dot in camera frame
-        Returns: (detected, x, y) where x,y are coordinates if detected, else None
+        Pre-render everything that doesn't change between frames: the target,
+        LED frames and labels, and the instructions go into one background
+        surface; lit LEDs become small sprites. Call again after a resize.
         """
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.background = pygame.Surface(self.screen.get_size()).convert()
+        self.draw_target(self.background)
+        # Lit LEDs are cut from a copy with every LED on, drawn over the same base
+        lit = self.background.copy()
+        self.draw_leds(self.background, {led: False for led in LED_POSITIONS})
+        self.draw_leds(lit, {led: True for led in LED_POSITIONS})
+        instr_text = self.small_font.render(INSTRUCTIONS, True, WHITE)
+        self.background.blit(instr_text, (SCREEN_WIDTH // 2 - 220, SCREEN_HEIGHT - 30))
         
-        # Threshold to find bright spots (laser)
-        _, thresh = cv2.threshold(gray, self.laser_threshold, 255, cv2.THRESH_BINARY)
+        self.led_sprites = {}
+        for led, pos in LED_POSITIONS.items():
+            self.led_sprites[led] = lit.subsurface(pygame.Rect(pos[0] - 16, pos[1] - 16, 33, 33)).copy()
+        
+        self.text_cache = {}
+        self.dirty_rects = []
+        self.needs_full_redraw = True
+    
+    def cached_text(self, key, text, font, color):
+        """Render text only when its content or color changed since last frame"""
+        cached = self.text_cache.get(key)
+        if cached is None or cached[0] != (text, color):
+            cached = ((text, color), font.render(text, True, color))
+            self.text_cache[key] = cached
+        return cached[1]
+    
+    def render_cached(self, show_camera=False):
+        """Blit the static layer, redraw only dynamic elements and update their rects"""
+        if self.needs_full_redraw:
+            self.screen.blit(self.background, (0, 0))
+        else:
+            # Erase whatever was drawn last frame by restoring the background under it
+            for rect in self.dirty_rects:
+                self.screen.blit(self.background, rect, rect)
+        
+        drawn = []
+        for led, pos in LED_POSITIONS.items():
+            if self.led_status[led]:
+                drawn.append(self.screen.blit(self.led_sprites[led], (pos[0] - 16, pos[1] - 16)))
+        for key, text, font, color, pos in self.hud_items():
+            drawn.append(self.screen.blit(self.cached_text(key, text, font, color), pos))
+        if show_camera:
+            drawn.append(self.display_camera_frame())
+        if self.show_hit and time.time() - self.last_hit_time < 0.5:  # Show for half second
+            drawn.append(self.draw_hit_marker())
+        
+        if self.needs_full_redraw:
+            pygame.display.flip()
+            self.needs_full_redraw = False
+        else:
+            pygame.display.update(self.dirty_rects + drawn)
+        self.dirty_rects = drawn
+    
+    def render_full(self, show_camera=False):
+        """Redraw the whole screen every frame (the original render path)"""
+        self.draw_target()
+        self.draw_leds()
+        self.display_info()
+        
+        # Draw camera frame if enabled
+        if show_camera:
+            self.display_camera_frame()
         
+        # Draw laser hit point if recent
+        if self.show_hit and time.time() - self.last_hit_time < 0.5:  # Show for half second
+            self.draw_hit_marker()
+        
+        # Update the display
+        pygame.display.flip()
+    
+    def draw_hit_marker(self):
+        """Draw the laser hit point; returns the area it covers"""
+        pygame.gfxdraw.filled_circle(self.screen, self.laser_x, self.laser_y, 5, BLUE)
+        pygame.gfxdraw.aacircle(self.screen, self.laser_x, self.laser_y, 5, WHITE)
+        return pygame.Rect(self.laser_x - 6, self.laser_y - 6, 13, 13)
+    
+    def find_largest_blob(self, mask, min_area):
+        """Largest contour of the non-zero pixels in a thresholded image, or None"""
         # Find contours
-        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         # Find the largest contour that meets our criteria
         largest_area = 0
@@ -192,26 +814,106 @@ class LaserDetectionSystem:
         
         for contour in contours:
             area = cv2.contourArea(contour)
-            if area > self.min_laser_area and area > largest_area:
+            if area > min_area and area > largest_area:
                 largest_area = area
                 largest_contour = contour
         
+        return largest_contour
+    
+    def clip_region(self, frame, cx, cy, half_size):
+        """Square region around (cx, cy) clipped to the frame, as (x0, y0, x1, y1)"""
+        height, width = frame.shape[:2]
+        half_size = int(half_size)
+        return (max(0, int(cx) - half_size), max(0, int(cy) - half_size),
+                min(width, int(cx) + half_size + 1), min(height, int(cy) + half_size + 1))
+    
+    def detect_in_region(self, frame, x0, y0, x1, y1, coarse=True):
+        """Detect the laser dot inside frame[y0:y1, x0:x1]; returns frame coordinates or None"""
+        if x1 <= x0 or y1 <= y0:
+            return None
+        
+        # Convert only the region to grayscale
+        gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        
+        scale = self.coarse_scale
+        if coarse and scale > 1 and min(gray.shape) >= scale * 8:
+            # Coarse pass: area-averaging the thresholded mask keeps any block
+            # that contains a bright pixel non-zero, so small dots survive
+            _, mask = cv2.threshold(gray, self.laser_threshold, 255, cv2.THRESH_BINARY)
+            coarse_mask = cv2.resize(mask, (gray.shape[1] // scale, gray.shape[0] // scale),
+                                     interpolation=cv2.INTER_AREA)
+            candidate = self.find_largest_blob(coarse_mask, self.min_laser_area / (scale * scale))
+            if candidate is None:
+                return None
+            
+            # Fine pass at full resolution around the candidate
+            bx, by, bw, bh = cv2.boundingRect(candidate)
+            fx0, fy0 = max(0, (bx - 1) * scale), max(0, (by - 1) * scale)
+            fx1, fy1 = min(gray.shape[1], (bx + bw + 1) * scale), min(gray.shape[0], (by + bh + 1) * scale)
+            gray = gray[fy0:fy1, fx0:fx1]
+            x0 += fx0
+            y0 += fy0
+        
+        # Threshold to find bright spots (laser)
+        if self.subpixel:
+            mask = threshold_levels(gray, self.laser_threshold)
+        else:
+            _, mask = cv2.threshold(gray, self.laser_threshold, 255, cv2.THRESH_BINARY)
+        contour = self.find_largest_blob(mask, self.min_laser_area)
+        
         # If we found a contour that could be the laser
-        if largest_contour is not None:
-            # Get the center of the contour
-            M = cv2.moments(largest_contour)
-            if M["m00"] != 0:
-                cx = int(M["m10"] / M["m00"])
-                cy = int(M["m01"] / M["m00"])
-                return True, cx, cy
+        if contour is None:
+            return None
+        
+        # Get the center of the contour
+        if self.subpixel:
+            centroid = weighted_centroid(mask, contour)
+        else:
+            centroid = contour_centroid(contour)
+            if centroid is not None:
+                centroid = int(centroid[0]), int(centroid[1])
+        if centroid is None:
+            return None
+        return x0 + centroid[0], y0 + centroid[1]
+    
+    def detect_laser(self, frame):
+        """
+        Detect laser dot in camera frame
+        In 'roi' mode only a small window around the last detected dot is
+        searched. When that window misses, the search falls back to the region
+        around the calibrated target and then, on that frame only, to the
+        whole frame; frames without a tracked dot search just the target region.
+        Returns: (detected, x, y) where x,y are coordinates if detected, else None
+        """
+        if self.detection_mode == 'full':
+            height, width = frame.shape[:2]
+            result = self.detect_in_region(frame, 0, 0, width, height)
+        else:
+            result = None
+            if self.last_detection is not None:
+                result = self.detect_in_region(
+                    frame, *self.clip_region(frame, *self.last_detection, self.track_window), coarse=False)
+            if result is None:
+                roi = self.clip_region(frame, self.cam_target_center_x, self.cam_target_center_y,
+                                       self.cam_target_radius * self.roi_margin)
+                result = self.detect_in_region(frame, *roi)
+                height, width = frame.shape[:2]
+                lost_track = self.last_detection is not None
+                if result is None and lost_track and roi != (0, 0, width, height):
+                    result = self.detect_in_region(frame, 0, 0, width, height)
         
-        return False, None, None
+        self.last_detection = result
+        if result is None:
+            return False, None, None
+        return True, result[0], result[1]
     
     def process_laser_position(self, frame_x, frame_y):
-        """Process laser position detected in camera frame"""
-        # Map camera coordinates to target coordinates
-        target_x = TARGET_CENTER_X + (frame_x - self.cam_target_center_x) * TARGET_RADIUS / self.cam_target_radius
-        target_y = TARGET_CENTER_Y + (frame_y - self.cam_target_center_y) * TARGET_RADIUS / self.cam_target_radius
+        """Process laser position detected in camera frame; returns the float target coordinates"""
+        # Map camera coordinates to target coordinates through the calibrated homography
+        h = self.homography_coeffs
+        w = h[6] * frame_x + h[7] * frame_y + h[8]
+        target_x = (h[0] * frame_x + h[1] * frame_y + h[2]) / w
+        target_y = (h[3] * frame_x + h[4] * frame_y + h[5]) / w
         
         self.laser_x = int(target_x)
         self.laser_y = int(target_y)
@@ -223,16 +925,9 @@ class LaserDetectionSystem:
         
         # Check if laser is within target
         if self.distance <= TARGET_RADIUS:
-            # Calculate score based on distance
-            ring_number = 10 - int(self.distance / RING_WIDTH)
-            if ring_number < 1:
-                ring_number = 1
-            self.score = ring_number
-            
             if self.distance <= BULL_RADIUS:
                 # Laser is in the bull's eye (10 ring)
                 self.set_leds(False, False, True)  # Green LED on
-                self.score = 10
             else:
                 # Laser is in target but not in bull's eye
                 self.set_leds(False, True, False)  # Yellow LED on
@@ -241,39 +936,126 @@ class LaserDetectionSystem:
             self.set_leds(True, False, False)  # Red LED on
             self.error_message = "ERROR: Laser outside target bounds"
             self.error_time = time.time()
+        
+        return target_x, target_y
     
-    def display_camera_frame(self, frame):
-        """Display camera frame on pygame surface"""
-        # Resize frame to fit in the display
+    def record_shot(self, shot):
+        """Score a completed shot and append it to the session store"""
+        self.score = ring_score(math.hypot(shot['x'], shot['y']))
+        self.shots.append(shot['time'], shot['x'], shot['y'], self.score,
+                          shot['kind'], shot['duration'], shot['trace'])
+    
+    def export_shots(self, path=None):
+        """Save the session's shots and aim traces to an .npz file"""
+        if path is None:
+            path = time.strftime("shots_%Y%m%d_%H%M%S.npz")
+        self.shots.export(path)
+        print(f"Exported {len(self.shots)} shots to {path}")
+        return path
+    
+    def setup_preview(self):
+        """
+        Allocate the preview buffer once and wrap it in a pygame Surface that
+        shares its memory, so refreshing the preview is just a resize into
+        the buffer with no further conversion or copies.
+        """
         display_width = SCREEN_WIDTH // 3
         display_height = int(display_width * self.frame_height / self.frame_width)
-        display_frame = cv2.resize(frame, (display_width, display_height))
-        
-        # Convert frame to pygame surface
-        display_frame = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-        display_frame = np.rot90(display_frame)
-        display_frame = pygame.surfarray.make_surface(display_frame)
-        display_frame = pygame.transform.flip(display_frame, True, False)
-        
+        self.preview_size = (display_width, display_height)
+        self.preview_scale = display_width / self.frame_width
+        self.preview_pos = (SCREEN_WIDTH - display_width - 10, SCREEN_HEIGHT - display_height - 40)
+        self.preview_bgr = np.zeros((display_height, display_width, 3), dtype=np.uint8)
+        try:
+            # Rows of (B, G, R) pixels are already what the surface expects
+            self.preview_surface = pygame.image.frombuffer(self.preview_bgr, self.preview_size, 'BGR')
+            self.preview_swap_channels = False
+        except ValueError:
+            # pygame < 2.1.3 has no BGR buffers; swap channels in place instead
+            self.preview_surface = pygame.image.frombuffer(self.preview_bgr, self.preview_size, 'RGB')
+            self.preview_swap_channels = True
+    
+    def update_preview(self, frame, laser_pos=None):
+        """Downscale the frame into the shared preview buffer and draw the overlay there"""
+        cv2.resize(frame, self.preview_size, dst=self.preview_bgr)
+        self.draw_target_overlay(self.preview_bgr, self.preview_scale)
+        if laser_pos is not None:
+            # Add visual indicator of detected laser position
+            center = (int(round(laser_pos[0] * self.preview_scale)), int(round(laser_pos[1] * self.preview_scale)))
+            cv2.circle(self.preview_bgr, center, max(2, int(10 * self.preview_scale)), (0, 255, 255), -1)
+        if self.preview_swap_channels:
+            cv2.cvtColor(self.preview_bgr, cv2.COLOR_BGR2RGB, dst=self.preview_bgr)
+    
+    def display_camera_frame(self):
+        """Display the latest camera preview on screen; returns the area it covers"""
         # Position in bottom-right corner
-        self.screen.blit(display_frame, (SCREEN_WIDTH - display_width - 10, SCREEN_HEIGHT - display_height - 40))
+        return self.screen.blit(self.preview_surface, self.preview_pos)
+        
+    def draw_target_overlay(self, frame, scale=1.0):
+        """Draw target overlay on camera frame (scaled for a downscaled preview)"""
+        thickness = max(1, int(round(2 * scale)))
+        outer, bull = ((ring * scale).astype(np.int32) for ring in self.cam_rings)
         
-    def draw_target_overlay(self, frame):
-        """Draw target overlay on camera frame"""
-        # Draw the target circles on the camera feed for alignment
-        cv2.circle(frame, (self.cam_target_center_x, self.cam_target_center_y), 
-                  self.cam_target_radius, (0, 255, 0), 2)
+        # Draw the calibrated target outline on the camera feed for alignment
+        cv2.polylines(frame, [outer], True, (0, 255, 0), thickness)
         
         # Draw bull's eye
-        bull_radius = int(self.cam_target_radius * BULL_RADIUS / TARGET_RADIUS)
-        cv2.circle(frame, (self.cam_target_center_x, self.cam_target_center_y), 
-                  bull_radius, (0, 0, 255), 2)
+        cv2.polylines(frame, [bull], True, (0, 0, 255), thickness)
         
         return frame
     
+    def process_frame(self, frame, capture_time, frame_time=None):
+        """
+        Mirror, detect and score one camera frame; returns the completed shot, if any.
+        capture_time is the perf_counter() time the frame was grabbed (for latency);
+        frame_time, if given, is the frame's own timestamp used for shot timing,
+        so recordings can be replayed faster than real time.
+        """
+        if frame_time is None:
+            frame_time = capture_time
+        stage_start = time.perf_counter()
+        
+        # Mirror frame for more intuitive interaction (into a reused buffer)
+        if self.mirror_buffer is None or self.mirror_buffer.shape != frame.shape:
+            self.mirror_buffer = np.empty_like(frame)
+        frame = cv2.flip(frame, 1, dst=self.mirror_buffer)
+        mirrored = time.perf_counter()
+        
+        # Detect laser in frame
+        detected, laser_x, laser_y = self.detect_laser(frame)
+        self.laser_detected = detected
+        detected_at = time.perf_counter()
+        
+        # Refresh the camera preview at its own, lower rate
+        if (not self.headless and self.show_camera
+                and frame_time - self.last_preview_time >= self.preview_interval):
+            self.update_preview(frame, (laser_x, laser_y) if detected else None)
+            self.last_preview_time = frame_time
+        previewed = time.perf_counter()
+        
+        if detected:
+            # Process the laser position
+            target_x, target_y = self.process_laser_position(laser_x, laser_y)
+            shot = self.shot_detector.update(frame_time, True,
+                                             target_x - TARGET_CENTER_X, target_y - TARGET_CENTER_Y)
+        else:
+            shot = self.shot_detector.update(frame_time, False)
+        if shot is not None:
+            self.record_shot(shot)
+        self.detect_rate.tick()
+        now = time.perf_counter()
+        self.frame_latency = now - capture_time
+        
+        if self.stage_times is not None:
+            self.stage_times['mirror'].append(mirrored - stage_start)
+            self.stage_times['detect'].append(detected_at - mirrored)
+            self.stage_times['preview'].append(previewed - detected_at)
+            self.stage_times['score'].append(now - previewed)
+        return shot
+    
     def run(self):
         """Main program loop"""
         clock = pygame.time.Clock()
+        self.capture.start()
         
         while self.running:
             # Event handling
@@ -286,51 +1068,42 @@ class LaserDetectionSystem:
                     elif event.key == pygame.K_c:
                         # Toggle camera view
                         self.show_camera = not self.show_camera
+                    elif event.key == pygame.K_e:
+                        self.export_shots()
+                    elif event.key == pygame.K_k and self.mirror_buffer is not None:
+                        # Recalibrate on the last camera frame
+                        self.calibrate(self.mirror_buffer)
+                        self.needs_full_redraw = True
+                    elif event.key == pygame.K_r:
+                        # Switch between cached and full redraw to compare render time
+                        self.cached_render = not self.cached_render
+                        self.needs_full_redraw = True
             
-            # Capture frame from camera
-            ret, frame = self.cap.read()
-            if not ret:
-                print("Failed to grab frame")
-                break
-            
-            # Mirror frame for more intuitive interaction
-            frame = cv2.flip(frame, 1)
-            
-            # Draw target overlay on camera frame
-            overlay_frame = self.draw_target_overlay(frame.copy())
+            # Take the newest frame from the capture thread
+            frame, capture_time = self.capture.latest()
+            if frame is None:
+                if self.capture.failed:
+                    print("Failed to grab frame")
+                    break
+                continue
             
-            # Detect laser in frame
-            detected, laser_x, laser_y = self.detect_laser(frame)
-            self.laser_detected = detected
-            
-            if detected:
-                # Add visual indicator of detected laser position
-                cv2.circle(overlay_frame, (laser_x, laser_y), 10, (0, 255, 255), -1)
-                
-                # Process the laser position
-                self.process_laser_position(laser_x, laser_y)
+            self.process_frame(frame, capture_time)
             
             # Draw elements
-            self.draw_target()
-            self.draw_leds()
-            self.display_info()
-            
-            # Draw camera frame if enabled
-            if self.show_camera:
-                self.display_camera_frame(overlay_frame)
-            
-            # Draw laser hit point if recent
-            if self.show_hit and time.time() - self.last_hit_time < 0.5:  # Show for half second
-                pygame.gfxdraw.filled_circle(self.screen, self.laser_x, self.laser_y, 5, BLUE)
-                pygame.gfxdraw.aacircle(self.screen, self.laser_x, self.laser_y, 5, WHITE)
-            
-            # Update the display
-            pygame.display.flip()
+            render_start = time.perf_counter()
+            if self.cached_render:
+                self.render_cached(self.show_camera)
+            else:
+                self.render_full(self.show_camera)
+            render_ms = (time.perf_counter() - render_start) * 1000
+            self.render_ms = render_ms if self.render_ms == 0.0 else 0.9 * self.render_ms + 0.1 * render_ms
+            self.display_rate.tick()
             
             # Cap the frame rate
             clock.tick(30)
         
         # Clean up
+        self.capture.stop()
         self.cap.release()
         pygame.quit()
 
@@ -350,30 +1123,237 @@ def setup_arduino():
         return None
 
 
-def update_arduino_leds(arduino, red, yellow, green):
+def led_command(red, yellow, green):
     """
-    Send LED states to Arduino
+    Serial command for a set of LED states
     Format: "LED:R{0/1}Y{0/1}G{0/1}\n"
     """
+    return f"LED:R{1 if red else 0}Y{1 if yellow else 0}G{1 if green else 0}\n".encode()
+
+
+def update_arduino_leds(arduino, red, yellow, green):
+    """Send LED states to Arduino (blocking; the run loop uses LedChannel instead)"""
     if arduino:
-        cmd = f"LED:R{1 if red else 0}Y{1 if yellow else 0}G{1 if green else 0}\n"
-        arduino.write(cmd.encode())
+        arduino.write(led_command(red, yellow, green))
+
+
+def open_arduino_serial(port=ARDUINO_PORT, baud=ARDUINO_BAUD):
+    """Open the Arduino serial port; raises if the device is not there"""
+    import serial
+    return serial.Serial(port, baud, write_timeout=1.0)
+
+
+class FakeSerial:
+    """
+    Serial stand-in for running without hardware. Records every write and
+    can simulate a slow link (write_delay) and a device that drops after
+    fail_after writes.
+    """
+    def __init__(self, write_delay=0.0, fail_after=None):
+        self.write_delay = write_delay
+        self.fail_after = fail_after
+        self.writes = []
+        self.is_open = True
+    
+    def write(self, data):
+        if not self.is_open:
+            raise OSError("port closed")
+        if self.fail_after is not None and len(self.writes) >= self.fail_after:
+            self.is_open = False
+            raise OSError("device disconnected")
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        self.writes.append(bytes(data))
+        return len(data)
+    
+    def close(self):
+        self.is_open = False
+
+
+class LedChannel:
+    """
+    Drives the hardware LEDs from a background thread so serial I/O never
+    stalls capture or detection. set() only records the newest wanted state;
+    the writer sends it when it differs from what the device last received,
+    so a burst of updates collapses into one write and repeats send nothing.
+    When a write fails the port is dropped and reopened every
+    reconnect_interval seconds, after which the current state is resent.
+    """
+    def __init__(self, opener=open_arduino_serial, reconnect_interval=2.0):
+        self.opener = opener
+        self.reconnect_interval = reconnect_interval
+        self.condition = threading.Condition()
+        self.wanted = None
+        self.sent = None
+        self.port = None
+        self.running = False
+        self.thread = None
+        self.updates = 0
+        self.writes = 0
+        self.reconnects = 0
+        self.open_failed = False
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._write_loop, name="led-channel", daemon=True)
+        self.thread.start()
+    
+    def stop(self, timeout=2.0):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self._close()
+    
+    @property
+    def connected(self):
+        return self.port is not None
+    
+    def set(self, red, yellow, green):
+        """Request an LED state; never blocks on the device"""
+        state = (bool(red), bool(yellow), bool(green))
+        with self.condition:
+            self.updates += 1
+            if state != self.wanted:
+                self.wanted = state
+                self.condition.notify()
+    
+    def _close(self):
+        if self.port is not None:
+            try:
+                self.port.close()
+            except Exception:
+                pass
+            self.port = None
+    
+    def _write_loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running or self.wanted != self.sent)
+                if not self.running:
+                    return
+                state = self.wanted
+            
+            if self.port is None:
+                try:
+                    self.port = self.opener()
+                    # Whatever the device showed before is unknown now
+                    self.sent = None
+                    self.reconnects += 1
+                    self.open_failed = False
+                except Exception as e:
+                    # Report once per outage, not on every retry
+                    if not self.open_failed:
+                        print(f"Arduino connection failed ({e}). Retrying every {self.reconnect_interval:g}s.")
+                        self.open_failed = True
+                    with self.condition:
+                        self.condition.wait_for(lambda: not self.running, self.reconnect_interval)
+                    continue
+            
+            # Serial I/O happens outside the lock so set() stays non-blocking
+            try:
+                self.port.write(led_command(*state))
+            except Exception as e:
+                print(f"Arduino write failed ({e}); reconnecting")
+                self._close()
+                continue
+            with self.condition:
+                self.sent = state
+                self.writes += 1
+
+
+def render_laser_dot(width, height, x, y, sigma=2.5, background=40, seed=None):
+    """Synthetic BGR frame with a Gaussian laser dot centred at sub-pixel (x, y)"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, background, (height, width), dtype=np.uint8).astype(np.float32)
+    xs = np.arange(width, dtype=np.float32)
+    ys = np.arange(height, dtype=np.float32)[:, None]
+    frame += 255.0 * np.exp(-((xs - x) ** 2 + (ys - y) ** 2) / (2 * sigma ** 2))
+    gray = np.clip(frame, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def benchmark_centroid(samples=500, width=160, height=120, threshold=220, seed=0):
+    """
+    Compare the integer contour-moment centroid with the brightness-weighted
+    sub-pixel one on synthetic dots at known positions: per-frame cost of
+    each whole localization path (threshold, contours, centroid) and mean error.
+    """
+    rng = np.random.default_rng(seed)
+    truths = rng.uniform([20, 20], [width - 20, height - 20], size=(samples, 2))
+    grays = [cv2.cvtColor(render_laser_dot(width, height, x, y, seed=i), cv2.COLOR_BGR2GRAY)
+             for i, (x, y) in enumerate(truths)]
+    
+    moments_time = weighted_time = 0.0
+    moments_err = []
+    weighted_err = []
+    for gray, (tx, ty) in zip(grays, truths):
+        start = time.perf_counter()
+        _, thresh = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contour = max(contours, key=cv2.contourArea)
+        mx, my = contour_centroid(contour)
+        mx, my = int(mx), int(my)
+        moments_time += time.perf_counter() - start
+        
+        start = time.perf_counter()
+        levels = threshold_levels(gray, threshold)
+        contours, _ = cv2.findContours(levels, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        contour = max(contours, key=cv2.contourArea)
+        wx, wy = weighted_centroid(levels, contour)
+        weighted_time += time.perf_counter() - start
+        
+        moments_err.append(math.hypot(mx - tx, my - ty))
+        weighted_err.append(math.hypot(wx - tx, wy - ty))
+    
+    print(f"Centroid benchmark ({samples} synthetic dots, {width}x{height}), threshold + contours + centroid")
+    print(f"  int contour moments:   {moments_time / samples * 1e6:7.1f} us/frame, "
+          f"mean error {np.mean(moments_err):.3f} px, max {np.max(moments_err):.3f} px")
+    print(f"  weighted sub-pixel:    {weighted_time / samples * 1e6:7.1f} us/frame, "
+          f"mean error {np.mean(weighted_err):.3f} px, max {np.max(weighted_err):.3f} px")
 
 
 # Main function
-def main():
-    # Setup Arduino (optional)
-    # arduino = setup_arduino()
+def main(source=0, calibrate=False, arduino_port=None, fake_arduino=False):
+    # Hardware LEDs (optional) are driven from their own thread
+    led_channel = None
+    if fake_arduino:
+        led_channel = LedChannel(opener=FakeSerial)
+    elif arduino_port:
+        led_channel = LedChannel(opener=lambda: open_arduino_serial(arduino_port))
     
     try:
         # Create and run laser detection system
-        laser_system = LaserDetectionSystem()
+        laser_system = LaserDetectionSystem(source, calibrate=calibrate)
+        if led_channel is not None:
+            laser_system.led_channel = led_channel
+            led_channel.start()
         laser_system.run()
     except Exception as e:
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        if led_channel is not None:
+            led_channel.stop()
+            print(f"LED updates: {led_channel.updates}, serial writes: {led_channel.writes}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Laser target detection system")
+    parser.add_argument('--bench-centroid', action='store_true',
+                        help="Benchmark the sub-pixel centroid against integer contour moments and exit")
+    parser.add_argument('--source', default='0', help="Camera index or video file")
+    parser.add_argument('--calibrate', action='store_true',
+                        help="Find the target in the first frame and save the calibration for this camera")
+    parser.add_argument('--arduino', nargs='?', const=ARDUINO_PORT, default=None, metavar='PORT',
+                        help=f"Drive hardware LEDs over serial (default port {ARDUINO_PORT})")
+    parser.add_argument('--fake-arduino', action='store_true', help="Drive a fake serial device instead")
+    args = parser.parse_args()
+    if args.bench_centroid:
+        benchmark_centroid()
+    else:
+        main(int(args.source) if args.source.isdigit() else args.source, args.calibrate,
+             args.arduino, args.fake_arduino)
\ No newline at end of file
@@ -1,24 +1,125 @@
+import time
+_import_start = time.perf_counter()
+
 import os
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras import layers, models
-import matplotlib.pyplot as plt
 from PIL import Image
+from flask import Flask, Response, request, jsonify, stream_with_context, g
+import io
+import zipfile
+import contextlib
 import shutil
-from sklearn.model_selection import train_test_split
-from flask import Flask, request, jsonify
 import tempfile
-import traceback
+from functools import partial
+import logging
+import threading
+import hashlib
+import sys
+import queue
+import json
+import bisect
+import heapq
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from error_categories import ERROR_CATEGORIES, ERROR_CATEGORIES_INFO, UNCERTAIN_CATEGORY
+
+# TensorFlow, matplotlib and sklearn are imported inside the functions that
+# need them so `main.py serve` only pays for the inference runtime it uses
+CORE_IMPORT_SECONDS = time.perf_counter() - _import_start
+
+# Modules worth calling out in the startup profile if something imports them eagerly
+HEAVY_MODULES = ('tensorflow', 'matplotlib', 'sklearn', 'torch')
+
+logger = logging.getLogger(__name__)
+
+# Micro-batching for the analyze endpoint: gather up to BATCH_MAX_SIZE images
+# or wait at most BATCH_MAX_WAIT_MS before running a single forward pass
+BATCH_MAX_SIZE = int(os.environ.get('SNYPTER_BATCH_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('SNYPTER_BATCH_WAIT_MS', '10'))
+
+# Worker count for decoding training images (0 = one per CPU core), and whether
+# they are processes instead of threads (for decoders that hold the GIL)
+DECODE_WORKERS = int(os.environ.get('SNYPTER_DECODE_WORKERS', '0'))
+DECODE_PROCESSES = os.environ.get('SNYPTER_DECODE_PROCESSES', '0') == '1'
+
+# Decoded images the streaming file pipeline keeps for reshuffling a cached dataset
+STREAM_SHUFFLE_BUFFER = int(os.environ.get('SNYPTER_STREAM_SHUFFLE_BUFFER', '256'))
+
+# Serving runtime: 'keras' loads the .h5 checkpoint, 'tflite' and 'torchscript'
+# load artifacts written by `python main.py export`, 'torch' loads the ResNet18
+# state dict saved by train.py
+RUNTIME_MODEL_PATHS = {
+    'keras': 'best_model.h5',
+    'tflite': 'best_model.tflite',
+    'torch': 'model.pth',
+    'torchscript': 'model.pt'
+}
+SERVING_RUNTIME = os.environ.get('SNYPTER_RUNTIME', 'keras')
+if SERVING_RUNTIME not in RUNTIME_MODEL_PATHS:
+    raise ValueError(f"Unknown SNYPTER_RUNTIME {SERVING_RUNTIME!r}, expected one of {', '.join(RUNTIME_MODEL_PATHS)}")
+SERVING_MODEL_PATH = os.environ.get('SNYPTER_MODEL_PATH') or RUNTIME_MODEL_PATHS[SERVING_RUNTIME]
+
+# TFLite runtime: interpreter threads (0 = this process's share of the cores, see
+# inference_threads). `serve --inference-threads` overrides both runtimes' settings.
+TFLITE_THREADS = int(os.environ.get('SNYPTER_TFLITE_THREADS', '0'))
 
-# Define error categories
-ERROR_CATEGORIES = [
-    'frontsight_dip',
-    'overtight_grip',
-    'acute_angle_trigger',
-    'stance_position',
-    'breath_control',
-    'early_recoil'
-]
+# PyTorch runtime: intra-op threads (0 = this process's share of the cores) and how
+# the state dict is prepared ('trace' = frozen TorchScript, 'compile' = torch.compile, 'eager')
+TORCH_THREADS = int(os.environ.get('SNYPTER_TORCH_THREADS', '0'))
+TORCH_MODE = os.environ.get('SNYPTER_TORCH_MODE', 'trace')
+
+# Production server (`python main.py serve`): pre-forked gunicorn workers with a
+# thread pool each. Timeouts are in seconds.
+SERVER_BIND = os.environ.get('SNYPTER_BIND', '0.0.0.0:5000')
+SERVER_WORKERS = int(os.environ.get('SNYPTER_WORKERS', '2'))
+SERVER_THREADS = int(os.environ.get('SNYPTER_THREADS', '8'))
+SERVER_TIMEOUT = int(os.environ.get('SNYPTER_TIMEOUT', '60'))
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SNYPTER_GRACEFUL_TIMEOUT', '30'))
+REQUEST_TIMEOUT = float(os.environ.get('SNYPTER_REQUEST_TIMEOUT', '30'))
+MAX_UPLOAD_MB = float(os.environ.get('SNYPTER_MAX_UPLOAD_MB', '16'))
+
+# Batch analysis (/api/analyze/batch and `python main.py analyze`): images are read,
+# decoded and scored BATCH_ANALYZE_SIZE at a time, so memory stays bounded however
+# large the session. Whole sessions get their own upload limit; single images
+# inside folders or archives are capped at MAX_IMAGE_MB.
+BATCH_ANALYZE_SIZE = int(os.environ.get('SNYPTER_BATCH_ANALYZE_SIZE', str(BATCH_MAX_SIZE)))
+BATCH_MAX_UPLOAD_MB = float(os.environ.get('SNYPTER_BATCH_MAX_UPLOAD_MB', '1024'))
+MAX_IMAGE_MB = float(os.environ.get('SNYPTER_MAX_IMAGE_MB', '32'))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Batch uploads kept in memory up to this size (werkzeug's own threshold), spooled to disk beyond it
+UPLOAD_SPOOL_BYTES = 500 * 1024
+
+# Runtimes whose model is loaded and warmed up once in the server's master
+# process and shared copy-on-write by the forked workers. The others load in
+# every worker: TensorFlow deadlocks in a forked child once initialized, and
+# loading a PyTorch model runs forward passes (tracing, warm-up) and sets the
+# intra-op thread count, which starts an OpenMP pool that breaks across fork.
+PREFORK_RUNTIMES = ('tflite',)
+
+# Prediction cache for repeated uploads; set SNYPTER_CACHE_DIR to keep results across restarts
+PREDICTION_CACHE_SIZE = int(os.environ.get('SNYPTER_CACHE_SIZE', '1024'))
+PREDICTION_CACHE_TTL = float(os.environ.get('SNYPTER_CACHE_TTL', '3600'))
+PREDICTION_CACHE_DIR = os.environ.get('SNYPTER_CACHE_DIR') or None
+# Files kept in SNYPTER_CACHE_DIR; expired and oldest entries are pruned past this
+PREDICTION_CACHE_DISK_SIZE = int(os.environ.get('SNYPTER_CACHE_DISK_SIZE', '10000'))
+
+# Request metrics served on /metrics in the Prometheus text format. Every server
+# worker counts its own requests and writes a snapshot to METRICS_DIR every
+# METRICS_FLUSH_SECONDS; /metrics reports the sum over all of them. `serve`
+# uses a temporary directory when several workers run and none is set.
+METRICS_DIR = os.environ.get('SNYPTER_METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = float(os.environ.get('SNYPTER_METRICS_FLUSH_SECONDS', '5'))
+# Totals of every worker that has exited, kept in METRICS_DIR next to the live snapshots
+EXITED_WORKERS_SNAPSHOT = 'exited-workers.json'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Sampling profiler for slow requests (off when PROFILE_SLOWEST is 0): keeps the
+# sampled stacks of the PROFILE_SLOWEST slowest requests, served on /api/profiles
+# and written to PROFILE_DIR as flamegraph-ready folded stacks when set
+PROFILE_SLOWEST = int(os.environ.get('SNYPTER_PROFILE_SLOWEST', '0'))
+PROFILE_INTERVAL_MS = float(os.environ.get('SNYPTER_PROFILE_INTERVAL_MS', '5'))
+PROFILE_DIR = os.environ.get('SNYPTER_PROFILE_DIR') or None
 
 
 def setup_folders():
@@ -40,46 +141,196 @@ def upload_images():
     input("Press Enter once you're done organizing images...")
 
 
-def process_image(image_path, target_size=(224, 224)):
-    """Process individual images"""
-    img = Image.open(image_path)
+def decode_image(image, target_size=(224, 224)):
+    """Decode a path, raw bytes or a file-like object into a uint8 (H, W, 3) array"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+    img = Image.open(image)
+    if img.format == 'JPEG':
+        # Let libjpeg downscale by 1/2, 1/4 or 1/8 while decoding instead of
+        # decoding a full-resolution phone photo and shrinking it afterwards
+        img.draft('RGB', target_size)
     img = img.convert('RGB')
     img = img.resize(target_size)
-    return np.array(img) / 255.0
+    return np.asarray(img, dtype=np.uint8)
+
+
+def normalize_images(images):
+    """Scale uint8 pixels to float32 in [0, 1]"""
+    img_array = np.asarray(images, dtype=np.float32)
+    img_array /= 255.0
+    return img_array
 
 
-def prepare_dataset():
-    """Prepare images and labels for training"""
-    images = []
-    labels = []
+def process_image(image, target_size=(224, 224)):
+    """Process individual images from a path, raw bytes or a file-like object"""
+    return normalize_images(decode_image(image, target_size))
 
+
+def list_dataset_files():
+    """Return [(path, label_index)] for every training image, in a stable order"""
+    files = []
     for idx, category in enumerate(ERROR_CATEGORIES):
         path = f'training_data/{category}'
         if not os.path.exists(path):
             print(f"Warning: Directory {path} does not exist")
             continue
 
-        for img_name in os.listdir(path):
-            if img_name.endswith(('.jpg', '.jpeg', '.png')):
-                img_path = os.path.join(path, img_name)
-                try:
-                    img_array = process_image(img_path)
-                    images.append(img_array)
-                    # One-hot encoding for categories
-                    label = np.zeros(len(ERROR_CATEGORIES))
-                    label[idx] = 1
-                    labels.append(label)
-                except Exception as e:
-                    print(f"Error processing {img_path}: {e}")
-
-    if not images:
+        for img_name in sorted(os.listdir(path)):
+            if img_name.endswith(IMAGE_EXTENSIONS):
+                files.append((os.path.join(path, img_name), idx))
+    return files
+
+
+def _images_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _load_dataset_manifest(cache_dir, target_size):
+    """
+    Return ({path: entry}, images memmap) from a previous run, or ({}, None)
+    when there is none or the manifest does not belong to images.npy (e.g.
+    a run was killed between replacing one and the other)
+    """
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    images_path = os.path.join(cache_dir, 'images.npy')
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if tuple(manifest['target_size']) != tuple(target_size):
+            return {}, None
+        if manifest['images_stamp'] != _images_stamp(images_path):
+            print(f"Ignoring dataset cache {cache_dir}: manifest does not match images.npy")
+            return {}, None
+        cached = np.load(images_path, mmap_mode='r')
+        entries = manifest['entries']
+        if len(entries) != cached.shape[0] or any(not 0 <= entry['index'] < len(entries) for entry in entries):
+            print(f"Ignoring dataset cache {cache_dir}: manifest rows do not match images.npy")
+            return {}, None
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}, None
+    return {entry['path']: entry for entry in entries}, cached
+
+
+def _decode_for_dataset(args):
+    """Pool worker: decode one training image, reporting failures instead of raising"""
+    img_path, target_size = args
+    try:
+        return decode_image(img_path, target_size), None
+    except Exception as e:
+        return None, str(e)
+
+
+def decode_images_parallel(paths, target_size=(224, 224), workers=DECODE_WORKERS, use_processes=DECODE_PROCESSES):
+    """
+    Decode many images on a thread (or process) pool. Results come back in the
+    same order as paths, as (array, None) on success or (None, error) on failure.
+    """
+    if not paths:
+        return []
+    workers = workers or os.cpu_count() or 1
+    pool_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    start = time.perf_counter()
+    jobs = [(path, target_size) for path in paths]
+    if workers == 1:
+        results = [_decode_for_dataset(job) for job in jobs]
+    else:
+        with pool_cls(max_workers=workers) as pool:
+            results = list(pool.map(_decode_for_dataset, jobs, chunksize=8 if use_processes else 1))
+    elapsed = time.perf_counter() - start
+    kind = 'processes' if use_processes else 'threads'
+    print(f"Decoded {len(paths)} images with {workers} {kind} in {elapsed:.2f}s "
+          f"({len(paths) / max(elapsed, 1e-9):.1f} images/s)")
+    return results
+
+
+def prepare_dataset(cache_dir='dataset_cache', target_size=(224, 224), workers=DECODE_WORKERS, use_processes=DECODE_PROCESSES):
+    """
+    Prepare images and labels for training.
+
+    Decoded images are kept as uint8 in <cache_dir>/images.npy alongside a
+    manifest of path, mtime, size and label. Later runs only decode new or
+    changed files (in parallel, see decode_images_parallel) and return the
+    rest as a read-only memory map; use normalize_images() per batch to get
+    float input for the model.
+    """
+    files = list_dataset_files()
+    previous, cached = _load_dataset_manifest(cache_dir, target_size)
+
+    candidates = []
+    to_decode = []
+    for img_path, idx in files:
+        try:
+            stat = os.stat(img_path)
+        except OSError as e:
+            print(f"Error processing {img_path}: {e}")
+            continue
+        entry = {'path': img_path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'label': idx}
+        old = previous.get(img_path)
+        if (cached is not None and old is not None and old['mtime_ns'] == entry['mtime_ns']
+                and old['size'] == entry['size'] and old['label'] == idx):
+            candidates.append((entry, old['index']))
+        else:
+            candidates.append((entry, None))
+            to_decode.append(img_path)
+
+    decoded_results = iter(decode_images_parallel(to_decode, target_size, workers, use_processes))
+
+    entries = []
+    rows = []
+    decoded = 0
+    for entry, cached_row in candidates:
+        if cached_row is None:
+            img_array, error = next(decoded_results)
+            if error is not None:
+                print(f"Error processing {entry['path']}: {error}")
+                continue
+            rows.append(img_array)
+            decoded += 1
+        else:
+            rows.append(cached_row)
+        entry['index'] = len(entries)
+        entries.append(entry)
+
+    if not entries:
         raise ValueError("No images found in training_data directory. Please add training images.")
 
-    return np.array(images), np.array(labels)
+    # One-hot encoding for categories
+    labels = np.zeros((len(entries), len(ERROR_CATEGORIES)), dtype=np.float32)
+    labels[np.arange(len(entries)), [entry['label'] for entry in entries]] = 1
+
+    images_path = os.path.join(cache_dir, 'images.npy')
+    unchanged = decoded == 0 and len(entries) == len(previous) and rows == list(range(len(rows)))
+    if unchanged:
+        print(f"Loaded {len(entries)} images from cache {cache_dir}")
+        return cached, labels
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = images_path + '.tmp.npy'
+    images = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.uint8, shape=(len(entries),) + tuple(target_size)[::-1] + (3,))
+    for i, row in enumerate(rows):
+        images[i] = cached[row] if isinstance(row, int) else row
+    images.flush()
+    del images, cached
+    # The manifest records the array's size and mtime (os.replace keeps both),
+    # so a manifest left over from before a crash can't be paired with it
+    stamp = _images_stamp(tmp_path)
+    os.replace(tmp_path, images_path)
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'target_size': list(target_size), 'images_stamp': stamp, 'entries': entries}, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    print(f"Decoded {decoded} new or changed images, reused {len(entries) - decoded} from cache {cache_dir}")
+    return np.load(images_path, mmap_mode='r'), labels
 
 
 def create_model(input_shape=(224, 224, 3)):
     """Create the CNN model"""
+    from tensorflow.keras import layers, models
+
     model = models.Sequential([
         layers.Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
         layers.MaxPooling2D((2, 2)),
@@ -99,28 +350,158 @@ def create_model(input_shape=(224, 224, 3)):
     return model
 
 
-def train_model(model, images, labels, epochs=20, batch_size=32):
-    """Train the model with validation split"""
-    X_train, X_val, y_train, y_val = train_test_split(
-        images, labels, test_size=0.2, random_state=42)
+def iterate_batches(images, labels, indices, batch_size, shuffle=False, seed=42):
+    """Yield normalized float32 batches forever, converting uint8 rows one batch at a time"""
+    rng = np.random.default_rng(seed)
+    indices = np.asarray(indices)
+    while True:
+        order = rng.permutation(indices) if shuffle else indices
+        for start in range(0, len(order), batch_size):
+            # Sorted rows read the memory-mapped cache sequentially
+            batch_idx = np.sort(order[start:start + batch_size])
+            yield normalize_images(images[batch_idx]), labels[batch_idx]
+
+
+def training_callbacks():
+    """Early stopping plus best-checkpoint saving shared by every training mode"""
+    import tensorflow as tf
 
     # Add early stopping to prevent overfitting
-    callbacks = [
+    return [
         tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=3),
         tf.keras.callbacks.ModelCheckpoint(
             'best_model.h5', save_best_only=True, monitor='val_accuracy')
     ]
 
-    history = model.fit(X_train, y_train,
+
+def train_model(model, images, labels, epochs=20, batch_size=32):
+    """Train the model with validation split"""
+    from sklearn.model_selection import train_test_split
+
+    train_idx, val_idx = train_test_split(
+        np.arange(len(labels)), test_size=0.2, random_state=42)
+
+    history = model.fit(iterate_batches(images, labels, train_idx, batch_size, shuffle=True),
+                        steps_per_epoch=int(np.ceil(len(train_idx) / batch_size)),
+                        epochs=epochs,
+                        validation_data=iterate_batches(images, labels, val_idx, batch_size),
+                        validation_steps=int(np.ceil(len(val_idx) / batch_size)),
+                        callbacks=training_callbacks())
+    return history
+
+
+def _batch_and_prefetch(ds, batch_size):
+    """Batch uint8 images, normalize each batch to float32 and overlap with training"""
+    import tensorflow as tf
+
+    ds = ds.batch(batch_size)
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) / 255.0, y),
+                num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def make_file_dataset(files, batch_size, shuffle=False, cache='memory', target_size=(224, 224), seed=42):
+    """
+    tf.data pipeline over (path, label_index) pairs. Images are decoded with
+    the same PIL path as inference (decode_image) on parallel map calls.
+    cache is 'memory', None, or a filename prefix for an on-disk tf.data cache.
+    Shuffling happens on the paths, before decoding, so no more than
+    STREAM_SHUFFLE_BUFFER decoded images are ever held for it.
+    """
+    import tensorflow as tf
+
+    paths = [path for path, _ in files]
+    labels = np.eye(len(ERROR_CATEGORIES), dtype=np.float32)[[idx for _, idx in files]]
+    image_shape = tuple(target_size)[::-1] + (3,)
+
+    def load(path):
+        path = path.decode()
+        try:
+            return decode_image(path, target_size)
+        except Exception as e:
+            print(f"Error processing {path}: {e}")
+            raise
+
+    def load_tf(path, label):
+        img = tf.numpy_function(load, [path], tf.uint8)
+        img.set_shape(image_shape)
+        return img, label
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if shuffle:
+        # Shuffling paths is free; without a cache this reshuffles every epoch fully
+        ds = ds.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(load_tf, num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.apply(tf.data.experimental.ignore_errors())
+    if cache is not None:
+        ds = ds.cache('' if cache == 'memory' else cache)
+        if shuffle:
+            # The cache replays the first epoch's order; a bounded buffer varies it per epoch
+            ds = ds.shuffle(min(len(paths), STREAM_SHUFFLE_BUFFER), seed=seed, reshuffle_each_iteration=True)
+    return _batch_and_prefetch(ds, batch_size)
+
+
+def make_cache_dataset(images, labels, indices, batch_size, shuffle=False, seed=42):
+    """tf.data pipeline over rows of the memory-mapped uint8 cache from prepare_dataset"""
+    import tensorflow as tf
+
+    image_shape = images.shape[1:]
+
+    def load(i):
+        return np.asarray(images[i]), labels[i]
+
+    def load_tf(i):
+        img, label = tf.numpy_function(load, [i], (tf.uint8, tf.float32))
+        img.set_shape(image_shape)
+        label.set_shape(labels.shape[1:])
+        return img, label
+
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices))
+    if shuffle:
+        # Shuffling row indices is free; the pixels stay in the memory map
+        ds = ds.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(load_tf, num_parallel_calls=tf.data.AUTOTUNE)
+    return _batch_and_prefetch(ds, batch_size)
+
+
+def train_model_streaming(model, source='files', epochs=20, batch_size=32, cache='memory', workers=DECODE_WORKERS,
+                          use_processes=DECODE_PROCESSES):
+    """
+    Train from a tf.data pipeline instead of whole-dataset arrays. source is
+    'files' (decode straight from training_data/) or 'cache' (read rows of the
+    prepare_dataset memory map). The 80/20 split is made on file lists or row
+    indices with a fixed seed, so it is the same on every run.
+    """
+    from sklearn.model_selection import train_test_split
+
+    if source == 'cache':
+        images, labels = prepare_dataset(workers=workers, use_processes=use_processes)
+        train_idx, val_idx = train_test_split(
+            np.arange(len(labels)), test_size=0.2, random_state=42)
+        train_ds = make_cache_dataset(images, labels, train_idx, batch_size, shuffle=True)
+        val_ds = make_cache_dataset(images, labels, val_idx, batch_size)
+    else:
+        files = list_dataset_files()
+        if not files:
+            raise ValueError("No images found in training_data directory. Please add training images.")
+        train_files, val_files = train_test_split(files, test_size=0.2, random_state=42)
+        disk_cache = cache not in (None, 'memory')
+        train_ds = make_file_dataset(train_files, batch_size, shuffle=True,
+                                     cache=f'{cache}_train' if disk_cache else cache)
+        val_ds = make_file_dataset(val_files, batch_size,
+                                   cache=f'{cache}_val' if disk_cache else cache)
+
+    history = model.fit(train_ds,
                         epochs=epochs,
-                        batch_size=batch_size,
-                        validation_data=(X_val, y_val),
-                        callbacks=callbacks)
+                        validation_data=val_ds,
+                        callbacks=training_callbacks())
     return history
 
 
 def plot_training_history(history):
     """Plot training and validation accuracy/loss"""
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(12, 4))
 
     # Plot accuracy
@@ -153,65 +534,1159 @@ def save_model(model, filename='stance_error_model.h5'):
 
 def load_model(filename='best_model.h5'):
     """Load a saved model"""
+    from tensorflow.keras import models
     return models.load_model(filename)
 
 
-def predict_error(model, image_path):
-    """Predict error category for new image"""
+def warm_up_model(model, input_shape=(224, 224, 3)):
+    """Run a dummy forward pass so the first real request doesn't pay for graph building"""
+    dummy = np.zeros((1,) + tuple(input_shape), dtype=np.float32)
+    model.predict(dummy, verbose=0)
+
+
+# Processes running a model at once; serve_production sets it to the gunicorn worker count
+serving_processes = 1
+
+
+def inference_threads(requested=0):
+    """
+    Intra-op threads for one model: the requested count, or else the cores
+    divided among the serving processes, so pre-forked workers don't each
+    claim every core
+    """
+    if requested:
+        return requested
+    return max(1, (os.cpu_count() or 1) // max(1, serving_processes))
+
+
+def _tflite_interpreter_class():
+    """Prefer the standalone interpreter packages so serving doesn't need full TensorFlow"""
     try:
-        img_array = process_image(image_path)
-        img_array = np.expand_dims(img_array, axis=0)
-        prediction = model.predict(img_array)
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+
+
+class TFLiteModel:
+    """Wraps a TFLite interpreter behind the same predict() call the Keras model exposes"""
+
+    def __init__(self, filename, num_threads=0):
+        interpreter_cls = _tflite_interpreter_class()
+        self.interpreter = interpreter_cls(model_path=filename,
+                                           num_threads=inference_threads(num_threads or TFLITE_THREADS))
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        # One interpreter can only run one invocation at a time
+        self._lock = threading.Lock()
+
+    def predict(self, batch, verbose=0):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output['index']).copy()
+
+
+def load_tflite_model(filename='best_model.tflite'):
+    """Load an exported TFLite model for serving"""
+    return TFLiteModel(filename)
+
+
+class TorchModel:
+    """
+    Wraps a PyTorch module behind the same predict() call the Keras model
+    exposes: NHWC float batches in [0, 1] in, softmax scores in
+    ERROR_CATEGORIES order out.
+    """
+
+    def __init__(self, module, num_threads=0):
+        import torch
+        self._torch = torch
+        # Intra-op threads are process-wide; pre-forked workers each claiming every
+        # core only adds contention
+        torch.set_num_threads(inference_threads(num_threads or TORCH_THREADS))
+        self.module = module
+        # train.py's ImageFolder numbers the classes in folder-name order
+        self._columns = [sorted(ERROR_CATEGORIES).index(category) for category in ERROR_CATEGORIES]
+
+    def predict(self, batch, verbose=0):
+        torch = self._torch
+        batch = np.asarray(batch, dtype=np.float32)
+        # NHWC memory viewed as NCHW is exactly the channels-last layout, so no copy is made
+        inputs = torch.from_numpy(batch).permute(0, 3, 1, 2)
+        with torch.inference_mode():
+            probabilities = torch.softmax(self.module(inputs).float(), dim=1)
+        return probabilities.numpy()[:, self._columns]
+
+
+def build_torch_resnet18(filename='model.pth'):
+    """ResNet18 with the fine-tuned head from a train.py state dict, in eval mode and channels-last"""
+    import torch
+    from torchvision import models
+    module = models.resnet18()
+    module.fc = torch.nn.Linear(module.fc.in_features, len(ERROR_CATEGORIES))
+    module.load_state_dict(torch.load(filename, map_location='cpu'))
+    return module.eval().to(memory_format=torch.channels_last)
+
+
+def trace_torch_module(module, input_shape=(224, 224, 3)):
+    """Frozen TorchScript graph of a module, traced on a channels-last example batch"""
+    import torch
+    example = torch.zeros((1, input_shape[2]) + tuple(input_shape[:2])).to(memory_format=torch.channels_last)
+    with torch.inference_mode():
+        return torch.jit.freeze(torch.jit.trace(module, example))
+
+
+def load_torch_model(filename='model.pth', mode=TORCH_MODE):
+    """Load the train.py checkpoint for serving, traced or compiled according to mode"""
+    module = build_torch_resnet18(filename)
+    if mode == 'trace':
+        module = trace_torch_module(module)
+    elif mode == 'compile':
+        import torch
+        module = torch.compile(module)
+    elif mode != 'eager':
+        raise ValueError(f"Unknown torch mode {mode!r}, expected 'trace', 'compile' or 'eager'")
+    return TorchModel(module)
+
+
+def load_torchscript_model(filename='model.pt'):
+    """Load a TorchScript export; needs torch but not torchvision"""
+    import torch
+    return TorchModel(torch.jit.load(filename, map_location='cpu'))
+
+
+RUNTIME_LOADERS = {
+    'keras': load_model,
+    'tflite': load_tflite_model,
+    'torch': load_torch_model,
+    'torchscript': load_torchscript_model
+}
+
+
+def load_serving_model(runtime=SERVING_RUNTIME, path=None):
+    """Load a model with any runtime; path defaults to the runtime's usual artifact"""
+    if runtime not in RUNTIME_LOADERS:
+        raise ValueError(f"Unknown runtime {runtime!r}, expected one of {', '.join(RUNTIME_LOADERS)}")
+    return RUNTIME_LOADERS[runtime](path or RUNTIME_MODEL_PATHS[runtime])
+
+
+def sample_dataset_images(count=100, seed=42):
+    """Deterministic random sample of preprocessed training images for calibration and parity checks"""
+    files = list_dataset_files()
+    if not files:
+        raise ValueError("No images found in training_data directory. Please add training images.")
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(len(files), size=min(count, len(files)), replace=False)
+    return np.stack([process_image(files[i][0]) for i in sorted(chosen)])
+
+
+def check_parity(reference, candidate, images, batch_size=32):
+    """Compare two models' softmax output on the same images"""
+    ref_out = np.concatenate([reference.predict(images[i:i + batch_size], verbose=0)
+                              for i in range(0, len(images), batch_size)])
+    cand_out = np.concatenate([candidate.predict(images[i:i + batch_size], verbose=0)
+                               for i in range(0, len(images), batch_size)])
+    return {
+        'images': len(images),
+        'top1_agreement': float(np.mean(ref_out.argmax(axis=1) == cand_out.argmax(axis=1))),
+        'max_abs_diff': float(np.max(np.abs(ref_out - cand_out))),
+        'mean_abs_diff': float(np.mean(np.abs(ref_out - cand_out)))
+    }
+
+
+def export_tflite(keras_path='best_model.h5', output_path='best_model.tflite', quantization='int8',
+                  calibration_samples=100, min_agreement=0.95):
+    """
+    Convert the Keras checkpoint to a post-training-quantized TFLite model.
+    int8 calibrates activations on a sample of training_data; float16 only
+    halves the weights. The exported model is checked against the Keras model
+    on the same sample; returns (passed, report).
+    """
+    import tensorflow as tf
+
+    keras_model = load_model(keras_path)
+    sample = sample_dataset_images(calibration_samples)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        def representative_dataset():
+            for img in sample:
+                yield [img[np.newaxis]]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected 'int8' or 'float16'")
 
-        confidences = prediction[0]
-        sorted_indices = np.argsort(confidences)[::-1]  # Sort descending
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
 
-        category = ERROR_CATEGORIES[sorted_indices[0]]
-        confidence = confidences[sorted_indices[0]]
+    report = check_parity(keras_model, load_tflite_model(output_path), sample)
+    report.update({
+        'output': output_path,
+        'quantization': quantization,
+        'keras_bytes': os.path.getsize(keras_path),
+        'tflite_bytes': os.path.getsize(output_path)
+    })
+    passed = report['top1_agreement'] >= min_agreement
+    print(f"Exported {output_path} ({quantization}, {report['tflite_bytes'] / 1e6:.1f} MB "
+          f"vs {report['keras_bytes'] / 1e6:.1f} MB Keras)")
+    print(f"Parity on {report['images']} images: top-1 agreement {report['top1_agreement']:.2%}, "
+          f"max |diff| {report['max_abs_diff']:.4f}")
+    if not passed:
+        print(f"Parity check FAILED: agreement below {min_agreement:.0%}")
+    return passed, report
 
+
+def export_torchscript(state_path='model.pth', output_path='model.pt', samples=100, min_agreement=0.95):
+    """
+    Trace the train.py checkpoint into a frozen TorchScript file that serves
+    without torchvision, checked against the eager model like export_tflite().
+    Returns (passed, report).
+    """
+    import torch
+
+    eager = build_torch_resnet18(state_path)
+    torch.jit.save(trace_torch_module(eager), output_path)
+
+    report = check_parity(TorchModel(eager), load_torchscript_model(output_path), sample_dataset_images(samples))
+    report.update({
+        'output': output_path,
+        'state_bytes': os.path.getsize(state_path),
+        'torchscript_bytes': os.path.getsize(output_path)
+    })
+    passed = report['top1_agreement'] >= min_agreement
+    print(f"Exported {output_path} ({report['torchscript_bytes'] / 1e6:.1f} MB)")
+    print(f"Parity on {report['images']} images: top-1 agreement {report['top1_agreement']:.2%}, "
+          f"max |diff| {report['max_abs_diff']:.4f}")
+    if not passed:
+        print(f"Parity check FAILED: agreement below {min_agreement:.0%}")
+    return passed, report
+
+
+def benchmark_runtimes(specs, images, batch_size=BATCH_MAX_SIZE, repeats=50):
+    """
+    Load each (runtime, path) in specs and time it on the same images:
+    load and warm-up time, single-image latency percentiles, throughput at
+    batch_size, and top-1 agreement with the first runtime. Returns one
+    report dict per runtime.
+    """
+    reports = []
+    reference = None
+    batch = np.stack([images[i % len(images)] for i in range(batch_size)])
+    for runtime, path in specs:
+        path = path or RUNTIME_MODEL_PATHS[runtime]
+        start = time.perf_counter()
+        model = load_serving_model(runtime, path)
+        load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        warm_up_model(model)
+        warm_up_seconds = time.perf_counter() - start
+
+        latencies = []
+        for i in range(repeats):
+            start = time.perf_counter()
+            model.predict(images[i % len(images)][np.newaxis], verbose=0)
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for _ in range(max(1, repeats // batch_size)):
+            model.predict(batch, verbose=0)
+        batch_seconds = (time.perf_counter() - start) / max(1, repeats // batch_size)
+
+        outputs = np.concatenate([model.predict(images[i:i + batch_size], verbose=0)
+                                  for i in range(0, len(images), batch_size)])
+        if reference is None:
+            reference = outputs
+        latencies_ms = np.array(latencies) * 1000
+        reports.append({
+            'runtime': runtime,
+            'path': path,
+            'load_seconds': load_seconds,
+            'warm_up_seconds': warm_up_seconds,
+            'latency_p50_ms': float(np.percentile(latencies_ms, 50)),
+            'latency_p95_ms': float(np.percentile(latencies_ms, 95)),
+            'single_images_per_second': 1000.0 / float(np.mean(latencies_ms)),
+            'batch_images_per_second': batch_size / batch_seconds,
+            'top1_agreement': float(np.mean(outputs.argmax(axis=1) == reference.argmax(axis=1)))
+        })
+        del model
+    return reports
+
+
+def print_benchmark(reports, images, batch_size):
+    print(f"\n=== Runtime benchmark ({images} images, batch {batch_size}) ===")
+    print(f"{'runtime':<13}{'load s':>8}{'warm s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'img/s x1':>10}{f'img/s x{batch_size}':>12}{'agree':>8}")
+    for r in reports:
+        print(f"{r['runtime']:<13}{r['load_seconds']:>8.2f}{r['warm_up_seconds']:>8.2f}"
+              f"{r['latency_p50_ms']:>9.2f}{r['latency_p95_ms']:>9.2f}{r['single_images_per_second']:>10.1f}"
+              f"{r['batch_images_per_second']:>12.1f}{r['top1_agreement']:>8.1%}")
+
+
+class ModelRegistry:
+    """
+    Keeps the serving model resident in memory and hot-swaps it when the
+    checkpoint on disk changes. Callers take a reference with get() and keep
+    using it for the whole request, so a swap never affects in-flight work.
+    """
+
+    def __init__(self, path='best_model.h5', check_interval=2.0, loader=load_model):
+        self.path = path
+        self.check_interval = check_interval
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._model = None
+        self._version = None
+        self._stamp = None
+        self._watcher = None
+        self.load_seconds = None
+        self.warm_up_seconds = None
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _file_hash(self):
+        digest = hashlib.sha256()
+        with open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    def load(self, warm_up=True):
+        """Load and (optionally) warm the checkpoint, then swap it in atomically"""
+        with self._reload_lock:
+            stamp = self._file_stamp()
+            version = self._file_hash()
+            if version == self._version:
+                self._stamp = stamp
+                return
+            start = time.perf_counter()
+            model = self.loader(self.path)
+            loaded = time.perf_counter()
+            if warm_up:
+                warm_up_model(model)
+            warmed = time.perf_counter()
+            with self._lock:
+                self._model = model
+                self._version = version
+                self._stamp = stamp
+                self.load_seconds = loaded - start
+                self.warm_up_seconds = warmed - loaded
+            print(f"Loaded model {self.path} (version {version}) in {warmed - start:.2f}s")
+
+    def get(self):
+        """Return the current (model, version) pair, loading it on first use"""
+        with self._lock:
+            model, version = self._model, self._version
+        if model is None:
+            self.load()
+            with self._lock:
+                model, version = self._model, self._version
+        return model, version
+
+    def check_for_update(self, warm_up=True):
+        """Reload the checkpoint if its mtime/size changed and its contents differ"""
+        try:
+            stamp = self._file_stamp()
+        except OSError:
+            return
+        if stamp == self._stamp:
+            return
+        try:
+            self.load(warm_up)
+        except Exception as e:
+            # The file may still be mid-write; keep serving the old model and retry later
+            print(f"Model reload failed, keeping version {self._version}: {e}")
+
+    def start_watching(self):
+        """Poll the checkpoint in a background thread so swaps never happen on a request thread"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(self.check_interval)
+                self.check_for_update()
+
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+
+def interpret_prediction(confidences, verbose=False):
+    """Turn one row of softmax output into (category, confidence)"""
+    sorted_indices = np.argsort(confidences)[::-1]  # Sort descending
+
+    category = ERROR_CATEGORIES[sorted_indices[0]]
+    confidence = confidences[sorted_indices[0]]
+
+    if verbose:
         print("\nConfidence scores for all error types:")
         for idx in sorted_indices:
             error_type = ERROR_CATEGORIES[idx]
             print(f"{error_type}: {confidences[idx]:.2%}")
 
-        if confidence < 0.5:
-            return "Uncertain (Low Confidence)", confidence
+    if confidence < 0.5:
+        return UNCERTAIN_CATEGORY, confidence
+
+    return category, confidence
+
 
-        return category, confidence
+def predict_error(model, image_path, verbose=False):
+    """Predict error category for new image"""
+    try:
+        img_array = process_image(image_path)
+        img_array = np.expand_dims(img_array, axis=0)
+        prediction = model.predict(img_array)
+        return interpret_prediction(prediction[0], verbose)
     except Exception as e:
         print(f"Error during prediction: {e}")
         return None, None
 
 
-# Error category information
-ERROR_CATEGORIES_INFO = {
-    'frontsight_dip': {
-        'description': 'Incorrect W formed by dip of front sight',
-        'solution': 'Work on arm oriented exercises.'
-    },
-    'overtight_grip': {
-        'description': 'Extra pressure exercised on the grip',
-        'solution': 'Relax your grip  and hold the gun like giving a handshake.'
-    },
-    'acute_angle_trigger': {
-        'description': 'Rough handling of Trigger',
-        'solution': 'Maintain a 90 degree pace with the index finger and the trigger.'
-    },
-    'stance_position': {
-        'description': 'Improper foot positioning or weight distribution',
-        'solution': 'Maintain athletic stance with feet shoulder-width apart. Weight slightly forward, knees flexed. Fix your feet parallel to each other and stay directed towards the aiming area.'
-    },
-    'breath_control': {
-        'description': 'Irregular breathing pattern',
-        'solution': 'Follow box breathing and practice 4:8 ratio breathing regularly.'
-    },
-    'early_recoil': {
-        'description': 'Pulling the trigger before reaching the target due to anxiety',
-        'solution': 'Calm down and cancel shots if the hand is not stable and take regular breaks when needed.'
-    }
+class MicroBatcher:
+    """
+    Collects concurrent single-image requests and runs them through the model
+    as one stacked batch. A batch is dispatched once max_batch_size images are
+    queued or max_wait_ms has passed since the first one arrived.
+    """
+
+    def __init__(self, registry, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, metrics=None):
+        self.registry = registry
+        self.metrics = metrics
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self.batches_run = 0
+        self.images_run = 0
+        self.last_batch_size = 0
+        self.largest_batch_size = 0
+        self.batch_size_counts = {}
+
+    def _ensure_started(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._worker.start()
+
+    def submit(self, img_array):
+        """Queue one preprocessed (H, W, C) image; the Future resolves to (softmax_row, model_version)"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((img_array, future))
+        return future
+
+    def predict(self, img_array, timeout=None):
+        """Blocking helper around submit()"""
+        return self.submit(img_array).result(timeout=timeout)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            futures = [future for _, future in batch]
+            try:
+                model, version = self.registry.get()
+                stacked = np.stack([img for img, _ in batch])
+                start = time.perf_counter()
+                prediction = model.predict(stacked, verbose=0)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            if self.metrics is not None:
+                self.metrics.observe('snypter_model_batch_seconds', time.perf_counter() - start)
+
+            for future, row in zip(futures, prediction):
+                future.set_result((row, version))
+            self._record(len(batch))
+
+    def _record(self, size):
+        with self._stats_lock:
+            self.batches_run += 1
+            self.images_run += size
+            self.last_batch_size = size
+            self.largest_batch_size = max(self.largest_batch_size, size)
+            self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+
+    def stats(self):
+        """Queue depth and batch-size metrics for the stats endpoint"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches_run': self.batches_run,
+                'images_run': self.images_run,
+                'mean_batch_size': self.images_run / self.batches_run if self.batches_run else 0.0,
+                'last_batch_size': self.last_batch_size,
+                'largest_batch_size': self.largest_batch_size,
+                'batch_size_counts': {str(k): v for k, v in sorted(self.batch_size_counts.items())}
+            }
+
+
+class PredictionCache:
+    """
+    Bounded LRU of analyze results keyed on the hash of the uploaded bytes plus
+    the model version, with a TTL and an optional on-disk tier (one JSON file
+    per key) that survives restarts. The disk tier is swept every tenth of
+    disk_max_entries writes: expired files go first, then the oldest ones
+    until at most disk_max_entries are left.
+    """
+
+    def __init__(self, max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL, disk_dir=PREDICTION_CACHE_DIR,
+                 disk_max_entries=PREDICTION_CACHE_DISK_SIZE):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_entries = max(1, int(disk_max_entries))
+        self._prune_every = max(1, self.disk_max_entries // 10)
+        self._disk_writes = 0
+        self._prune_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.disk_pruned = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._prune_disk()
+
+    @staticmethod
+    def make_key(image_hash, model_version):
+        return f"{model_version}-{image_hash}"
+
+    def _expired(self, stored_at, now):
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry['stored_at'], now):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry['stored_at'], entry['result']
+
+    def _disk_put(self, key, stored_at, result):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        # Workers forked from one master reuse thread idents, so the pid is part of the name too
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'stored_at': stored_at, 'result': result}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write prediction cache entry %s: %s", path, e)
+            return
+        with self._lock:
+            self._disk_writes += 1
+            due = self._disk_writes % self._prune_every == 0
+        if due:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Delete expired entries, then the oldest ones beyond disk_max_entries"""
+        # One sweep at a time; writers that find one running just skip theirs
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.time()
+            files = []
+            with os.scandir(self.disk_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.json'):
+                        continue
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        continue
+            files.sort()
+            # The file's mtime is when it was stored
+            expired = [path for mtime, path in files if self._expired(mtime, now)]
+            kept = [path for mtime, path in files if not self._expired(mtime, now)]
+            stale = expired + kept[:max(0, len(kept) - self.disk_max_entries)]
+            removed = 0
+            for path in stale:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+            with self._lock:
+                self.disk_pruned += removed
+        finally:
+            self._prune_lock.release()
+
+    def _insert(self, key, stored_at, result):
+        self._entries[key] = (stored_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """Return the cached result for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if not self._expired(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+                self.expirations += 1
+
+        entry = self._disk_get(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._insert(key, *entry)
+            return entry[1]
+
+    def put(self, key, result):
+        stored_at = time.time()
+        with self._lock:
+            self._insert(key, stored_at, result)
+        self._disk_put(key, stored_at, result)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'disk_dir': self.disk_dir,
+                'disk_max_entries': self.disk_max_entries,
+                'disk_pruned': self.disk_pruned,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+# name -> (type, help) for everything ServiceMetrics exports, in /metrics order
+METRICS = {
+    'snypter_requests_total': ('counter', "HTTP requests by endpoint and status code"),
+    'snypter_request_seconds': ('histogram', "Request latency by endpoint, including streamed bodies"),
+    'snypter_stage_seconds': ('histogram', "Time spent per image in each stage: read, cache, decode, predict, serialize"),
+    'snypter_model_batch_seconds': ('histogram', "Model forward pass per micro-batch"),
+    'snypter_predictions_total': ('counter', "Model predictions by category, with low-confidence results as 'uncertain'")
 }
 
 
+class Histogram:
+    """Observation counts per latency bucket (the last one is +Inf), with their sum"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, counts, total):
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+        self.sum += total
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class ServiceMetrics:
+    """
+    Counters and latency histograms for the server, rendered in the Prometheus
+    text format. Series are keyed on (metric name, sorted label pairs). With a
+    directory set, a background thread writes this process's snapshot there
+    every flush_seconds and render() sums the snapshots of all processes, so
+    any worker can answer a scrape for the whole server. Exiting workers
+    retire() into a single snapshot for all exited workers.
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_seconds=METRICS_FLUSH_SECONDS, buckets=LATENCY_BUCKETS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._flusher_pid = None
+        self._start_lock = threading.Lock()
+        self._process_pid = None
+        self._process_name = None
+        self._retired = False
+        # Every category shows up on /metrics from the start, even at zero
+        for category in ERROR_CATEGORIES + ['uncertain']:
+            self._counters[('snypter_predictions_total', (('category', category),))] = 0
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._ensure_flushing()
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+        self._ensure_flushing()
+
+    def observe_stage(self, stage, seconds):
+        self.observe('snypter_stage_seconds', seconds, stage=stage)
+
+    def count_prediction(self, category):
+        self.inc('snypter_predictions_total', category='uncertain' if category == UNCERTAIN_CATEGORY else category)
+
+    def record_request(self, endpoint, status, seconds):
+        self.inc('snypter_requests_total', endpoint=endpoint, status=status)
+        self.observe('snypter_request_seconds', seconds, endpoint=endpoint)
+
+    def snapshot(self):
+        """This process's series as JSON-friendly lists"""
+        with self._lock:
+            return self._as_snapshot(self._counters, self._histograms)
+
+    def _snapshot_path(self):
+        """
+        This process's snapshot file, named by pid and start time so a worker
+        that reuses a dead worker's pid never overwrites its final totals
+        """
+        pid = os.getpid()
+        if self._process_pid != pid:
+            self._process_pid = pid
+            self._process_name = f"worker-{pid}-{time.time_ns()}.json"
+        return os.path.join(self.directory, self._process_name)
+
+    @contextlib.contextmanager
+    def _directory_lock(self, exclusive=False):
+        """
+        Lock on the snapshot directory where fcntl exists: shared while
+        snapshots are written or read, exclusive while a worker retires
+        """
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def clear_directory(self):
+        """Drop snapshots left by an earlier server run"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Write this process's snapshot for the other workers to read"""
+        if not self.directory:
+            return
+        path = self._snapshot_path()
+        try:
+            with self._directory_lock():
+                if not self._retired:
+                    self._write_json(path, self.snapshot())
+        except OSError as e:
+            logger.warning("Could not write metrics snapshot %s: %s", path, e)
+
+    def retire(self):
+        """
+        Fold this exiting process's totals into the exited-workers snapshot
+        and remove its own, so counters never go backwards and recycled
+        workers don't leave a file each
+        """
+        if not self.directory:
+            return
+        path = self._snapshot_path()
+        exited_path = os.path.join(self.directory, EXITED_WORKERS_SNAPSHOT)
+        try:
+            with self._directory_lock(exclusive=True):
+                self._retired = True
+                snapshots = [self.snapshot()]
+                try:
+                    with open(exited_path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    pass
+                self._write_json(exited_path, self._as_snapshot(*self._merge(snapshots)))
+                if os.path.exists(path):
+                    os.remove(path)
+        except OSError as e:
+            logger.warning("Could not fold metrics snapshot %s into %s: %s", path, exited_path, e)
+
+    def _ensure_flushing(self):
+        # Started lazily so each forked worker gets its own thread
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def _collect(self):
+        """Snapshots of this process and, with a directory, every other process that wrote one"""
+        snapshots = [self.snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            own = os.path.basename(self._snapshot_path())
+            with self._directory_lock():
+                for name in sorted(os.listdir(self.directory)):
+                    if not name.endswith('.json') or name == own:
+                        continue
+                    try:
+                        with open(os.path.join(self.directory, name)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        return snapshots
+
+    def _merge(self, snapshots):
+        """Sum snapshots into ({(name, labels): value}, {(name, labels): Histogram})"""
+        counters = {}
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, counts, total in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                if key not in histograms:
+                    histograms[key] = Histogram(self.buckets)
+                histograms[key].merge(counts, total)
+        return counters, histograms
+
+    @staticmethod
+    def _as_snapshot(counters, histograms):
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+            'histograms': [[name, labels, list(h.counts), h.sum] for (name, labels), h in histograms.items()]
+        }
+
+    def render(self):
+        """All series in the Prometheus text exposition format"""
+        counters, histograms = self._merge(self._collect())
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (series, labels), value in sorted(counters.items()):
+                    if series == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            for (series, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+                if series != name:
+                    continue
+                cumulative = 0
+                bounds = [f"{bound:g}" for bound in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer:
+    """Splits a request's wall time into named stages, recording each into the metrics as it ends"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = self.last = time.perf_counter()
+        self.stages = {}
+
+    def mark(self, stage):
+        """End the current stage; it covers the time since the previous mark"""
+        now = time.perf_counter()
+        seconds = now - self.last
+        self.last = now
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.metrics.observe_stage(stage, seconds)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def fold_stack(frame, prefix=''):
+    """A frame's call stack as 'outer;...;inner' of file:function entries (the folded flamegraph format)"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return prefix + ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler that keeps the stacks of the slowest requests. While a
+    request runs, a background thread samples its thread's stack every
+    interval, along with the shared_threads that do work on its behalf (the
+    micro-batcher runs the model). Finished requests that rank among the
+    `keep` slowest so far are kept with their folded stacks and stage times.
+    """
+
+    def __init__(self, keep=PROFILE_SLOWEST, interval_ms=PROFILE_INTERVAL_MS, dump_dir=PROFILE_DIR,
+                 shared_threads=('micro-batcher',)):
+        self.keep = max(0, int(keep))
+        self.interval = max(1.0, interval_ms) / 1000.0
+        self.dump_dir = dump_dir
+        if dump_dir and self.keep:
+            os.makedirs(dump_dir, exist_ok=True)
+        self.shared_threads = set(shared_threads)
+        self._active = {}
+        self._slowest = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._sampler_pid = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.keep > 0
+
+    def _ensure_started(self):
+        if self._sampler_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._sampler_pid != os.getpid():
+                self._sampler_pid = os.getpid()
+                threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True).start()
+
+    def start(self):
+        """Start sampling the calling thread; returns the token to pass to finish()"""
+        if not self.enabled:
+            return None
+        self._ensure_started()
+        token = (threading.get_ident(), {})
+        with self._lock:
+            self._active[token[0]] = token[1]
+        return token
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            shared = [fold_stack(frames[thread.ident], f"[{thread.name}];") for thread in threading.enumerate()
+                      if thread.name in self.shared_threads and thread.ident in frames]
+            # A shared thread blocked on its queue is idle, not working for anyone
+            shared = [stack for stack in shared if not stack.endswith('threading.py:wait')]
+            for ident, samples in active:
+                frame = frames.get(ident)
+                stacks = shared + ([fold_stack(frame)] if frame is not None else [])
+                for stack in stacks:
+                    samples[stack] = samples.get(stack, 0) + 1
+            del frames
+
+    def finish(self, token, label, seconds, stages):
+        """Stop sampling a request and keep its profile if it is one of the slowest"""
+        if token is None:
+            return
+        ident, samples = token
+        with self._lock:
+            if self._active.get(ident) is samples:
+                del self._active[ident]
+            if len(self._slowest) >= self.keep and seconds <= self._slowest[0][0]:
+                return
+            self._sequence += 1
+            profile = {
+                'request': label,
+                'seconds': seconds,
+                'stages': stages,
+                'pid': os.getpid(),
+                'time': time.time(),
+                'samples': sum(samples.values()),
+                'stacks': dict(samples)
+            }
+            entry = (seconds, self._sequence, profile)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+                evicted = None
+            else:
+                evicted = heapq.heapreplace(self._slowest, entry)[2]
+        self._dump(profile, evicted)
+
+    def _dump_path(self, profile):
+        return os.path.join(self.dump_dir, f"{profile['pid']}-{int(profile['time'] * 1000)}")
+
+    def _dump(self, profile, evicted):
+        """Write <name>.folded (stacks only, for flamegraph tools) and <name>.json; drop the evicted profile's files"""
+        if not self.dump_dir:
+            return
+        if evicted is not None:
+            for extension in ('.folded', '.json'):
+                try:
+                    os.remove(self._dump_path(evicted) + extension)
+                except OSError:
+                    pass
+        path = self._dump_path(profile)
+        try:
+            with open(path + '.folded', 'w') as f:
+                for stack, count in sorted(profile['stacks'].items(), key=lambda item: -item[1]):
+                    f.write(f"{stack} {count}\n")
+            with open(path + '.json', 'w') as f:
+                json.dump({key: value for key, value in profile.items() if key != 'stacks'}, f, indent=2)
+        except OSError as e:
+            logger.warning("Could not write request profile %s: %s", path, e)
+
+    def slowest(self):
+        """Kept profiles, slowest first"""
+        with self._lock:
+            return [profile for _, _, profile in sorted(self._slowest, key=lambda entry: entry[0], reverse=True)]
+
+
+def process_memory(pid='self'):
+    """
+    Memory of a process in MB. On Linux: rss (all resident pages), pss (shared
+    pages divided among the processes sharing them) and private (pages only
+    this process holds). Summing pss over the workers gives the real footprint.
+    """
+    fields = {'Rss': 'rss_mb', 'Pss': 'pss_mb', 'Private_Clean': 'private_mb', 'Private_Dirty': 'private_mb'}
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    key = fields[name]
+                    memory[key] = memory.get(key, 0.0) + int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KB elsewhere
+        memory['max_rss_mb'] = max_rss / 1e6 if sys.platform == 'darwin' else max_rss / 1024
+    return {key: round(value, 1) for key, value in memory.items()}
+
+
+def profile_startup(registry, runtime=SERVING_RUNTIME):
+    """Load the serving model and print where startup time went"""
+    timings = [('core imports (numpy, PIL, flask)', CORE_IMPORT_SECONDS)]
+
+    start = time.perf_counter()
+    if runtime == 'tflite':
+        _tflite_interpreter_class()
+        timings.append(('import tflite interpreter', time.perf_counter() - start))
+    elif runtime in ('torch', 'torchscript'):
+        import torch  # noqa: F401
+        timings.append(('import torch', time.perf_counter() - start))
+    else:
+        import tensorflow  # noqa: F401
+        timings.append(('import tensorflow', time.perf_counter() - start))
+
+    registry.load()
+    timings.append((f'load {registry.path}', registry.load_seconds or 0.0))
+    timings.append(('model warm-up', registry.warm_up_seconds or 0.0))
+
+    print("\n=== Startup profile ===")
+    for label, seconds in timings:
+        print(f"{label:<40} {seconds * 1000:9.1f} ms")
+    print(f"{'total':<40} {sum(seconds for _, seconds in timings) * 1000:9.1f} ms")
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(f"Heavy modules loaded: {', '.join(loaded) if loaded else 'none'}\n")
+
+
 def main():
     # Setup training environment
     print("=== Shooting Form Error Detection Model Training ===")
@@ -256,8 +1731,8 @@ def main():
 
             # Load the best saved model for prediction
             try:
-                best_model = load_model('best_model.h5')
-                category, confidence = predict_error(best_model, image_path)
+                best_model = load_serving_model()
+                category, confidence = predict_error(best_model, image_path, verbose=True)
 
                 if category:
                     print(f"\nDetected Error: {category}")
@@ -276,6 +1751,35 @@ def main():
 
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+model_registry = ModelRegistry(SERVING_MODEL_PATH, loader=RUNTIME_LOADERS[SERVING_RUNTIME])
+service_metrics = ServiceMetrics()
+request_profiler = SlowRequestProfiler()
+batcher = MicroBatcher(model_registry, metrics=service_metrics)
+prediction_cache = PredictionCache()
+
+
+@app.before_request
+def start_request_timing():
+    g.stage_timer = StageTimer(service_metrics)
+    g.profile = request_profiler.start()
+
+
+@app.after_request
+def record_request_timing(response):
+    # Recorded once the body has been sent, so streamed responses count in full
+    timer, profile = g.stage_timer, g.profile
+    endpoint = request.endpoint or 'unmatched'
+    label = f"{request.method} {request.full_path.rstrip('?')}"
+
+    def finish():
+        seconds = timer.elapsed()
+        service_metrics.record_request(endpoint, response.status_code, seconds)
+        request_profiler.finish(profile, label, seconds, timer.stages)
+
+    response.call_on_close(finish)
+    return response
+
 
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
@@ -284,36 +1788,459 @@ def analyze():
     file = request.files['image']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
+    timer = g.stage_timer
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp:
-            file.save(tmp.name)
-            image_path = tmp.name
-
-        model = load_model('best_model.h5')
-        category, confidence = predict_error(model, image_path)
-
-        description = ''
-        solution = ''
-        if category in ERROR_CATEGORIES_INFO:
-            description = ERROR_CATEGORIES_INFO[category]['description']
-            solution = ERROR_CATEGORIES_INFO[category]['solution']
-
-        result = {
-            'category': category,
-            'confidence': float(confidence) if confidence is not None else 0.0,
-            'description': description,
-            'solution': solution
-        }
-        return jsonify(result)
+        image_bytes = file.read()
+        timer.mark('read')
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        _, version = model_registry.get()
+        cached = prediction_cache.get(PredictionCache.make_key(image_hash, version))
+        timer.mark('cache')
+        if cached is not None:
+            response = jsonify(cached)
+            timer.mark('serialize')
+            return response
+
+        img_array = process_image(image_bytes)
+        timer.mark('decode')
+        try:
+            confidences, version = batcher.predict(img_array, timeout=REQUEST_TIMEOUT)
+        except FutureTimeoutError:
+            return jsonify({'error': 'Prediction timed out, try again'}), 503
+        category, confidence = interpret_prediction(confidences)
+        timer.mark('predict')
+        service_metrics.count_prediction(category)
+        result = build_result(category, confidence)
+        prediction_cache.put(PredictionCache.make_key(image_hash, version), result)
+        response = jsonify(result)
+        timer.mark('serialize')
+        return response
     except Exception as e:
-        print("Error in /api/analyze:", e)
-        traceback.print_exc()
+        logger.exception("Error in /api/analyze")
         return jsonify({'error': str(e)}), 500
 
 
+def build_result(category, confidence):
+    """Response body for one analyzed image"""
+    info = ERROR_CATEGORIES_INFO.get(category, {})
+    return {
+        'category': category,
+        'confidence': float(confidence) if confidence is not None else 0.0,
+        'description': info.get('description', ''),
+        'solution': info.get('solution', '')
+    }
+
+
+def _read_limited(path):
+    size = os.path.getsize(path)
+    if size > MAX_IMAGE_MB * 1024 * 1024:
+        raise ValueError(f"{size / (1024 * 1024):.1f} MB exceeds the {MAX_IMAGE_MB:g} MB image limit")
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _read_member(archive, member):
+    if member.file_size > MAX_IMAGE_MB * 1024 * 1024:
+        raise ValueError(f"{member.file_size / (1024 * 1024):.1f} MB exceeds the {MAX_IMAGE_MB:g} MB image limit")
+    return archive.read(member)
+
+
+def iter_zip_images(source, prefix=''):
+    """
+    Yield (name, read) for every image in a zip archive (a path or a seekable
+    file). Members are only read when read() is called, one at a time.
+    """
+    with zipfile.ZipFile(source) as archive:
+        for member in archive.infolist():
+            name = member.filename
+            if member.is_dir() or name.startswith('__MACOSX/') or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            yield prefix + name, partial(_read_member, archive, member)
+
+
+def iter_path_images(paths):
+    """Yield (name, read) for image files, folders (recursively, in name order) and zip archives"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full_path = os.path.join(root, name)
+                    if name.lower().endswith('.zip'):
+                        yield from iter_zip_images(full_path, full_path + '/')
+                    elif name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield full_path, partial(_read_limited, full_path)
+        elif zipfile.is_zipfile(path):
+            yield from iter_zip_images(path, path + '/')
+        else:
+            yield path, partial(_read_limited, path)
+
+
+def detach_upload(upload):
+    """
+    Copy an uploaded file into a temporary file owned by the caller. The
+    request closes its own upload files when the view returns, before a
+    streamed response has been generated. Like werkzeug, only uploads up to
+    UPLOAD_SPOOL_BYTES stay in memory; larger ones go to disk, so a session
+    of any size holds at most that much per file in RAM.
+    """
+    stream = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    shutil.copyfileobj(upload.stream, stream, 1 << 20)
+    stream.seek(0)
+    return upload.filename, stream
+
+
+def iter_upload_images(uploads):
+    """
+    Yield (name, read) for (filename, stream) uploads and for the images
+    inside uploaded zip archives; closes each stream when done with it.
+    """
+    for filename, stream in uploads:
+        try:
+            if zipfile.is_zipfile(stream):
+                stream.seek(0)
+                yield from iter_zip_images(stream, filename + '/')
+            else:
+                stream.seek(0)
+                yield filename, stream.read
+        finally:
+            stream.close()
+
+
+def _analyze_chunk(chunk):
+    """Score one chunk of (name, bytes or read error) items; returns results in input order"""
+    _, version = model_registry.get()
+    results = [None] * len(chunk)
+    pending = []
+    for i, (name, image_bytes) in enumerate(chunk):
+        try:
+            if isinstance(image_bytes, Exception):
+                raise image_bytes
+            start = time.perf_counter()
+            image_hash = hashlib.sha256(image_bytes).hexdigest()
+            cached = prediction_cache.get(PredictionCache.make_key(image_hash, version))
+            decode_start = time.perf_counter()
+            service_metrics.observe_stage('cache', decode_start - start)
+            if cached is not None:
+                results[i] = {'file': name, **cached}
+                continue
+            img_array = process_image(image_bytes)
+            service_metrics.observe_stage('decode', time.perf_counter() - decode_start)
+            # Submitting as soon as each image is decoded lets inference overlap the rest of the decoding
+            pending.append((i, name, image_hash, batcher.submit(img_array)))
+        except Exception as e:
+            results[i] = {'file': name, 'error': f"Could not read image: {e}"}
+    for i, name, image_hash, future in pending:
+        start = time.perf_counter()
+        try:
+            confidences, version = future.result(timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            results[i] = {'file': name, 'error': f"Prediction failed: {str(e) or 'timed out'}"}
+            continue
+        finally:
+            service_metrics.observe_stage('predict', time.perf_counter() - start)
+        category, confidence = interpret_prediction(confidences)
+        service_metrics.count_prediction(category)
+        result = build_result(category, confidence)
+        prediction_cache.put(PredictionCache.make_key(image_hash, version), result)
+        results[i] = {'file': name, **result}
+    return results
+
+
+def analyze_images(items, batch_size=BATCH_ANALYZE_SIZE):
+    """
+    Score (name, read) items batch_size at a time and yield one result dict
+    per image, in input order, as each chunk finishes. Only one chunk of
+    images is held in memory at once; images that can't be read or decoded
+    yield an 'error' result instead of stopping the stream.
+    """
+    chunk = []
+    for name, read in items:
+        # Read while the source (e.g. a zip member) is still open
+        start = time.perf_counter()
+        try:
+            chunk.append((name, read()))
+        except Exception as e:
+            chunk.append((name, e))
+        service_metrics.observe_stage('read', time.perf_counter() - start)
+        if len(chunk) == batch_size:
+            yield from _analyze_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from _analyze_chunk(chunk)
+
+
+def ndjson_results(results):
+    """Results as NDJSON lines, followed by a summary line"""
+    counts = {}
+    images = errors = 0
+    for result in results:
+        images += 1
+        if 'error' in result:
+            errors += 1
+        else:
+            counts[result['category']] = counts.get(result['category'], 0) + 1
+        start = time.perf_counter()
+        line = json.dumps(result) + '\n'
+        service_metrics.observe_stage('serialize', time.perf_counter() - start)
+        yield line
+    yield json.dumps({'summary': {'images': images, 'errors': errors, 'category_counts': counts}}) + '\n'
+
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    # Sessions get a larger limit than single images; werkzeug spools big uploads to disk
+    request.max_content_length = int(BATCH_MAX_UPLOAD_MB * 1024 * 1024)
+    uploads = [detach_upload(upload) for _, upload in request.files.items(multi=True) if upload.filename]
+    if not uploads:
+        return jsonify({'error': 'No images uploaded'}), 400
+    batch_size = min(max(request.args.get('batch_size', BATCH_ANALYZE_SIZE, type=int), 1), 256)
+    results = analyze_images(iter_upload_images(uploads), batch_size)
+    return Response(stream_with_context(ndjson_results(results)), mimetype='application/x-ndjson')
+
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    _, version = model_registry.get()
+    return jsonify({
+        'model_version': version,
+        'batcher': batcher.stats(),
+        'cache': prediction_cache.stats(),
+        'worker': {'pid': os.getpid(), 'memory': process_memory()}
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(service_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/profiles', methods=['GET'])
+def profiles():
+    if not request_profiler.enabled:
+        return jsonify({'error': 'Request profiling is off; set SNYPTER_PROFILE_SLOWEST to enable it'}), 404
+    return jsonify({'pid': os.getpid(), 'profiles': request_profiler.slowest()})
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({'error': f"Upload exceeds the {request.max_content_length / (1024 * 1024):g} MB limit"}), 413
+
+
+def serve_production(bind=SERVER_BIND, workers=SERVER_WORKERS, threads=SERVER_THREADS, timeout=SERVER_TIMEOUT,
+                     graceful_timeout=SERVER_GRACEFUL_TIMEOUT, watch=False, profile=False, runtime=SERVING_RUNTIME):
+    """
+    Run the app under gunicorn with pre-forked threaded workers. Runtimes in
+    PREFORK_RUNTIMES are loaded once here, before forking, so every worker
+    shares the weights copy-on-write; other runtimes load in each worker.
+    SIGHUP to the master reloads the checkpoint (when preloaded) and then
+    replaces the workers gracefully; SIGTERM drains in-flight requests.
+    With watch, every worker also polls the checkpoint for hot swaps
+    (each then holds its own copy of a swapped-in model). Workers share
+    their request metrics through service_metrics.directory, so /metrics
+    covers the whole server whichever worker answers.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    global serving_processes
+    serving_processes = workers
+
+    temporary_metrics_dir = workers > 1 and not service_metrics.directory
+    if temporary_metrics_dir:
+        service_metrics.directory = tempfile.mkdtemp(prefix='snypter-metrics-')
+    service_metrics.clear_directory()
+
+    preload = runtime in PREFORK_RUNTIMES
+    if preload:
+        if profile:
+            profile_startup(model_registry, runtime)
+        else:
+            model_registry.load()
+        print(f"Master {os.getpid()} loaded the model for sharing: {process_memory()}")
+
+    def post_fork(server, worker):
+        if not preload:
+            if profile:
+                profile_startup(model_registry, runtime)
+            else:
+                model_registry.load()
+        if watch:
+            model_registry.start_watching()
+
+    def post_worker_init(worker):
+        worker.log.info("Worker %s ready, memory %s", os.getpid(), process_memory())
+
+    def worker_exit(server, worker):
+        # Keep the exiting worker's counts in the server totals
+        service_metrics.retire()
+
+    def on_exit(server):
+        if temporary_metrics_dir:
+            shutil.rmtree(service_metrics.directory, ignore_errors=True)
+
+    def on_reload(server):
+        if preload:
+            model_registry.check_for_update()
+
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'keepalive': 5,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+        'on_exit': on_exit,
+        'on_reload': on_reload
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def train_from_cli(args):
+    """Non-interactive training used by `python main.py train`"""
+    model = create_model()
+    try:
+        if args.stream:
+            cache = None if args.tf_cache == 'none' else args.tf_cache
+            history = train_model_streaming(model, source=args.source, epochs=args.epochs,
+                                            batch_size=args.batch_size, cache=cache, workers=args.workers,
+                                            use_processes=args.decode_processes)
+        else:
+            images, labels = prepare_dataset(workers=args.workers, use_processes=args.decode_processes)
+            print(f"\nDataset prepared with {len(images)} images across {len(ERROR_CATEGORIES)} categories")
+            history = train_model(model, images, labels, epochs=args.epochs, batch_size=args.batch_size)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    save_model(model)
+    if args.plot:
+        plot_training_history(history)
+
+
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) > 1 and sys.argv[1] == "serve":
-        app.run(host="0.0.0.0", port=5000, debug=True)
+    import argparse
+    parser = argparse.ArgumentParser(description="Shooting form error detection")
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve_parser = subparsers.add_parser('serve', help="Run the /api/analyze server")
+    serve_parser.add_argument('--profile-startup', action='store_true',
+                              help="Report time spent on imports, model loading and warm-up")
+    serve_parser.add_argument('--bind', default=SERVER_BIND)
+    serve_parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help="Pre-forked worker processes")
+    serve_parser.add_argument('--threads', type=int, default=SERVER_THREADS, help="Request threads per worker")
+    serve_parser.add_argument('--timeout', type=int, default=SERVER_TIMEOUT,
+                              help="Seconds before an unresponsive worker is restarted")
+    serve_parser.add_argument('--graceful-timeout', type=int, default=SERVER_GRACEFUL_TIMEOUT,
+                              help="Seconds workers get to finish requests on reload or shutdown")
+    serve_parser.add_argument('--max-upload-mb', type=float, default=MAX_UPLOAD_MB)
+    serve_parser.add_argument('--inference-threads', type=int, default=0,
+                              help="Intra-op threads per worker for the tflite and torch runtimes "
+                                   "(default: the cores divided among the workers)")
+    serve_parser.add_argument('--watch', action='store_true',
+                              help="Hot-swap the checkpoint in every worker when it changes on disk")
+    serve_parser.add_argument('--dev', action='store_true',
+                              help="Use Flask's single-process debug server instead of gunicorn")
+
+    train_parser = subparsers.add_parser('train', help="Train on training_data/ without the interactive setup")
+    train_parser.add_argument('--epochs', type=int, default=20)
+    train_parser.add_argument('--batch-size', type=int, default=32)
+    train_parser.add_argument('--workers', type=int, default=DECODE_WORKERS,
+                              help="Image decode workers (0 = one per core)")
+    train_parser.add_argument('--decode-processes', action='store_true', default=DECODE_PROCESSES,
+                              help="Decode on a process pool instead of threads")
+    train_parser.add_argument('--stream', action='store_true',
+                              help="Stream batches through a tf.data pipeline instead of in-memory arrays")
+    train_parser.add_argument('--source', choices=['files', 'cache'], default='files',
+                              help="With --stream: decode from training_data/ or read the dataset cache")
+    train_parser.add_argument('--tf-cache', default='memory',
+                              help="With --stream --source files: 'memory', 'none' or a cache file prefix")
+    train_parser.add_argument('--plot', action='store_true', help="Show the training history plot")
+
+    export_parser = subparsers.add_parser('export', help="Export a lightweight model for serving")
+    export_parser.add_argument('--format', choices=['tflite', 'torchscript'], default='tflite',
+                               help="tflite: quantized Keras model; torchscript: traced train.py checkpoint")
+    export_parser.add_argument('--model', help="Source checkpoint (default best_model.h5 or model.pth)")
+    export_parser.add_argument('--output', help="Output file (default best_model.tflite or model.pt)")
+    export_parser.add_argument('--quantization', choices=['int8', 'float16'], default='int8')
+    export_parser.add_argument('--calibration-samples', type=int, default=100)
+    export_parser.add_argument('--min-agreement', type=float, default=0.95,
+                               help="Minimum top-1 agreement with the source model")
+
+    analyze_parser = subparsers.add_parser('analyze', help="Score image files, folders or zip archives as NDJSON")
+    analyze_parser.add_argument('paths', nargs='+', help="Images, folders (searched recursively) or .zip archives")
+    analyze_parser.add_argument('--batch-size', type=int, default=BATCH_ANALYZE_SIZE)
+    analyze_parser.add_argument('--output', help="Write NDJSON here instead of stdout")
+
+    bench_parser = subparsers.add_parser('bench', help="Compare latency and throughput of serving runtimes")
+    bench_parser.add_argument('--runtime', action='append', metavar='RUNTIME[=PATH]',
+                              help=f"Runtime to benchmark, repeatable ({', '.join(RUNTIME_LOADERS)}); "
+                                   f"the first one is the agreement reference. Default: all with a model file")
+    bench_parser.add_argument('--images', type=int, default=64, help="Images sampled from training_data/")
+    bench_parser.add_argument('--batch-size', type=int, default=BATCH_MAX_SIZE)
+    bench_parser.add_argument('--repeats', type=int, default=50, help="Single-image predictions to time")
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        app.config['MAX_CONTENT_LENGTH'] = int(args.max_upload_mb * 1024 * 1024)
+        if args.inference_threads:
+            TFLITE_THREADS = TORCH_THREADS = args.inference_threads
+        if args.dev:
+            if args.profile_startup:
+                profile_startup(model_registry)
+            else:
+                model_registry.load()
+            model_registry.start_watching()
+            host, _, port = args.bind.rpartition(':')
+            app.run(host=host or "0.0.0.0", port=int(port), debug=True)
+        else:
+            serve_production(args.bind, args.workers, args.threads, args.timeout, args.graceful_timeout,
+                             args.watch, args.profile_startup)
+    elif args.command == 'train':
+        train_from_cli(args)
+    elif args.command == 'export':
+        if args.format == 'torchscript':
+            passed, _ = export_torchscript(args.model or 'model.pth', args.output or 'model.pt',
+                                           args.calibration_samples, args.min_agreement)
+        else:
+            passed, _ = export_tflite(args.model or 'best_model.h5', args.output or 'best_model.tflite',
+                                      args.quantization, args.calibration_samples, args.min_agreement)
+        sys.exit(0 if passed else 1)
+    elif args.command == 'analyze':
+        # Keep stdout pure NDJSON; load messages go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            model_registry.load()
+        out = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for line in ndjson_results(analyze_images(iter_path_images(args.paths), args.batch_size)):
+                out.write(line)
+                out.flush()
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    elif args.command == 'bench':
+        if args.runtime:
+            specs = [tuple(spec.split('=', 1)) if '=' in spec else (spec, None) for spec in args.runtime]
+        else:
+            specs = [(runtime, path) for runtime, path in RUNTIME_MODEL_PATHS.items() if os.path.exists(path)]
+        if not specs:
+            print("No model files found; train or export one first, or pass --runtime RUNTIME=PATH")
+            sys.exit(1)
+        images = sample_dataset_images(args.images)
+        print_benchmark(benchmark_runtimes(specs, images, args.batch_size, args.repeats), len(images),
+                        args.batch_size)
     else:
-        main()
\ No newline at end of file
+        main()
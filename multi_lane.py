@@ -0,0 +1,349 @@
+import math
+import os
+import queue
+import threading
+import time
+import multiprocessing as mp
+import cv2
+import pygame
+from pygame import gfxdraw
+
+from laser_track import (LaserDetectionSystem, TARGET_RADIUS, RING_WIDTH, TARGET_CENTER_X, TARGET_CENTER_Y,
+                         WHITE, BLACK, RED, GREEN, YELLOW, GRAY, BLUE)
+
+# Scoreboard window
+BOARD_WIDTH = 1280
+BOARD_HEIGHT = 720
+
+# How often each lane posts a status update (seconds)
+STATUS_INTERVAL = 0.1
+
+# Longest a worker sleeps when none of its lanes has a frame ready (seconds)
+IDLE_POLL = 0.002
+
+
+def parse_source(text):
+    """Camera index for digits, otherwise a video file path"""
+    return int(text) if text.isdigit() else text
+
+
+class Lane:
+    """
+    Capture, detection and scoring state of one lane inside a worker. step()
+    handles at most one frame and never blocks, so one worker can take turns
+    over several lanes. Everything a lane reports goes through the results
+    queue as (kind, lane_id, payload) so lanes never wait on each other or on
+    the display.
+    """
+    def __init__(self, lane_id, source, results, realtime=True, calibrate=False):
+        self.lane_id = lane_id
+        self.results = results
+        self.realtime = realtime
+        self.done = False
+        try:
+            self.system = LaserDetectionSystem(source, headless=True, calibrate=calibrate)
+        except Exception as e:
+            results.put(('error', lane_id, str(e)))
+            self.done = True
+            return
+        
+        self.is_file = isinstance(source, str)
+        self.frame_period = 1.0 / (self.system.cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        if not self.is_file:
+            self.system.capture.start()
+        self.next_frame = time.perf_counter()
+        self.frame_index = 0
+        self.last_status = 0.0
+    
+    def due(self):
+        """When this lane next has work: the next frame's playback time for real-time files, otherwise now"""
+        return self.next_frame if self.is_file and self.realtime else 0.0
+    
+    def step(self):
+        """Process the next frame if one is ready; returns whether a frame was processed"""
+        system = self.system
+        if self.is_file:
+            if self.realtime:
+                # Play files back at their own frame rate, like a live camera
+                if time.perf_counter() < self.next_frame:
+                    return False
+                self.next_frame += self.frame_period
+            ret, frame = system.cap.read()
+            capture_time = time.perf_counter()
+            if not ret:
+                self.close()
+                return False
+            # Shots are timed on the video's own clock, whatever the playback speed
+            frame_time = self.frame_index * self.frame_period
+            self.frame_index += 1
+        else:
+            frame, capture_time = system.capture.latest(timeout=0)
+            if frame is None:
+                if system.capture.failed:
+                    self.close()
+                return False
+            frame_time = capture_time
+        
+        shot = system.process_frame(frame, capture_time, frame_time)
+        if shot is not None:
+            self.results.put(('shot', self.lane_id, {
+                'score': system.score,
+                'x': shot['x'],
+                'y': shot['y'],
+                'time': shot['time']
+            }))
+        
+        now = time.perf_counter()
+        if now - self.last_status >= STATUS_INTERVAL:
+            self.last_status = now
+            self.results.put(('status', self.lane_id, {
+                'fps': system.detect_rate.rate,
+                'latency': system.frame_latency,
+                'detected': system.laser_detected,
+                'x': system.laser_x - TARGET_CENTER_X,
+                'y': system.laser_y - TARGET_CENTER_Y,
+                'dropped': system.capture.frames_dropped
+            }))
+        return True
+    
+    def close(self):
+        if self.done:
+            return
+        self.done = True
+        if not self.is_file:
+            self.system.capture.stop()
+        self.system.cap.release()
+        self.results.put(('done', self.lane_id, None))
+
+
+def lane_worker(lane_sources, results, stop_event, realtime=True, calibrate=False):
+    """
+    Run a group of (lane_id, source) lanes in one thread or process, taking
+    turns frame by frame, until stopped or every source runs out.
+    """
+    # Workers already fill the cores; one OpenCV thread each avoids oversubscription
+    cv2.setNumThreads(1)
+    lanes = [Lane(lane_id, source, results, realtime, calibrate) for lane_id, source in lane_sources]
+    lanes = [lane for lane in lanes if not lane.done]
+    while lanes and not stop_event.is_set():
+        worked = False
+        for lane in lanes:
+            worked |= lane.step()
+        lanes = [lane for lane in lanes if not lane.done]
+        if lanes and not worked:
+            # Nothing was ready: sleep until the next file frame is due, polling cameras meanwhile
+            delay = min(lane.due() for lane in lanes) - time.perf_counter()
+            time.sleep(min(max(delay, 0.0), IDLE_POLL))
+    for lane in lanes:
+        lane.close()
+
+
+class LaneState:
+    """Latest known state of one lane on the scoreboard"""
+    def __init__(self, lane_id, source):
+        self.lane_id = lane_id
+        self.source = source
+        self.fps = 0.0
+        self.latency = 0.0
+        self.detected = False
+        self.x = 0.0
+        self.y = 0.0
+        self.dropped = 0
+        self.shots = 0
+        self.total = 0
+        self.last_score = None
+        self.last_shot = None
+        self.error = None
+        self.done = False
+
+
+class MultiLaneRunner:
+    """
+    Runs one detection lane per capture source on a pool of worker threads
+    (default) or processes and aggregates their results on a single
+    scoreboard. There are at most as many workers as cores; with more lanes
+    than that, each worker takes turns over several lanes.
+    """
+    def __init__(self, sources, use_processes=False, realtime=True, calibrate=False, workers=None):
+        self.sources = sources
+        self.use_processes = use_processes
+        self.realtime = realtime
+        self.calibrate = calibrate
+        self.worker_count = max(1, min(len(sources), workers or os.cpu_count() or 1))
+        if use_processes:
+            self.results = mp.Queue()
+            self.stop_event = mp.Event()
+        else:
+            self.results = queue.Queue()
+            self.stop_event = threading.Event()
+        self.lanes = [LaneState(i, source) for i, source in enumerate(sources)]
+        self.workers = []
+
+    def start(self):
+        for index in range(self.worker_count):
+            # Round-robin so every worker gets a similar share of the lanes
+            group = [(lane.lane_id, lane.source) for lane in self.lanes[index::self.worker_count]]
+            args = (group, self.results, self.stop_event, self.realtime, self.calibrate)
+            if self.use_processes:
+                worker = mp.Process(target=lane_worker, args=args, daemon=True)
+            else:
+                worker = threading.Thread(target=lane_worker, args=args, name=f'lanes-{index}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(timeout=2.0)
+
+    def poll(self):
+        """Apply every queued lane message without blocking"""
+        while True:
+            try:
+                kind, lane_id, payload = self.results.get_nowait()
+            except queue.Empty:
+                return
+            lane = self.lanes[lane_id]
+            if kind == 'status':
+                lane.fps = payload['fps']
+                lane.latency = payload['latency']
+                lane.detected = payload['detected']
+                lane.x, lane.y = payload['x'], payload['y']
+                lane.dropped = payload['dropped']
+            elif kind == 'shot':
+                lane.shots += 1
+                lane.total += payload['score']
+                lane.last_score = payload['score']
+                lane.last_shot = (payload['x'], payload['y'])
+            elif kind == 'error':
+                lane.error = payload
+                lane.done = True
+            elif kind == 'done':
+                lane.done = True
+
+    def all_done(self):
+        return all(lane.done for lane in self.lanes)
+
+    def report(self):
+        """One line per lane for console output"""
+        lines = []
+        for lane in self.lanes:
+            if lane.error:
+                lines.append(f"Lane {lane.lane_id + 1}: ERROR {lane.error}")
+                continue
+            lines.append(f"Lane {lane.lane_id + 1}: {lane.shots} shots, total {lane.total}, "
+                         f"last {lane.last_score if lane.last_score is not None else '-'} | "
+                         f"{lane.fps:5.1f} fps, {lane.latency * 1000:5.1f} ms latency, {lane.dropped} dropped"
+                         f"{' (finished)' if lane.done else ''}")
+        return "\n".join(lines)
+
+
+class Scoreboard:
+    """Pygame grid with a mini target and live stats per lane"""
+    def __init__(self, lanes):
+        pygame.init()
+        self.screen = pygame.display.set_mode((BOARD_WIDTH, BOARD_HEIGHT))
+        pygame.display.set_caption("Laser Range Scoreboard")
+        self.font = pygame.font.SysFont('Arial', 20)
+        self.small_font = pygame.font.SysFont('Arial', 14)
+        self.cols = math.ceil(math.sqrt(len(lanes)))
+        self.rows = math.ceil(len(lanes) / self.cols)
+        self.cell_w = BOARD_WIDTH // self.cols
+        self.cell_h = BOARD_HEIGHT // self.rows
+        self.target_radius = int(min(self.cell_w, self.cell_h - 60) * 0.4)
+        self.scale = self.target_radius / TARGET_RADIUS
+        self.cell_background = self.build_cell_background()
+
+    def build_cell_background(self):
+        """Pre-render the static part of a lane cell (frame and target rings)"""
+        cell = pygame.Surface((self.cell_w, self.cell_h)).convert()
+        cell.fill(BLACK)
+        pygame.draw.rect(cell, GRAY, cell.get_rect(), 1)
+        cx, cy = self.cell_w // 2, self.cell_h // 2 + 10
+        for i in range(1, 11):
+            radius = int((TARGET_RADIUS - (i - 1) * RING_WIDTH) * self.scale)
+            gfxdraw.aacircle(cell, cx, cy, max(radius, 1), RED if i == 10 else WHITE)
+        return cell
+
+    def draw(self, lanes):
+        for index, lane in enumerate(lanes):
+            ox = (index % self.cols) * self.cell_w
+            oy = (index // self.cols) * self.cell_h
+            self.screen.blit(self.cell_background, (ox, oy))
+            cx, cy = ox + self.cell_w // 2, oy + self.cell_h // 2 + 10
+
+            title = f"Lane {lane.lane_id + 1}"
+            if lane.error:
+                title += " - ERROR"
+            elif lane.done:
+                title += " - finished"
+            self.screen.blit(self.font.render(title, True, WHITE), (ox + 8, oy + 6))
+            last = lane.last_score if lane.last_score is not None else '-'
+            score_text = f"Last {last}  Total {lane.total}  Shots {lane.shots}"
+            self.screen.blit(self.small_font.render(score_text, True, WHITE), (ox + 8, oy + 30))
+            stats_text = f"{lane.fps:.0f} fps  {lane.latency * 1000:.0f} ms  {lane.dropped} dropped"
+            self.screen.blit(self.small_font.render(stats_text, True, GRAY), (ox + 8, oy + self.cell_h - 20))
+
+            if lane.last_shot is not None:
+                sx = int(cx + lane.last_shot[0] * self.scale)
+                sy = int(cy + lane.last_shot[1] * self.scale)
+                gfxdraw.filled_circle(self.screen, sx, sy, 4, YELLOW)
+            if lane.detected:
+                lx = int(cx + lane.x * self.scale)
+                ly = int(cy + lane.y * self.scale)
+                gfxdraw.filled_circle(self.screen, lx, ly, 3, BLUE)
+                gfxdraw.aacircle(self.screen, lx, ly, 3, GREEN)
+        pygame.display.flip()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Track several laser lanes in one process")
+    parser.add_argument('sources', nargs='+', help="Camera indices and/or video files, one per lane")
+    parser.add_argument('--processes', action='store_true',
+                        help="Run the lane workers as processes instead of threads")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Lane workers (default: one per core, never more than the lanes)")
+    parser.add_argument('--no-display', action='store_true', help="Print lane stats instead of the scoreboard")
+    parser.add_argument('--fast', action='store_true', help="Read video files as fast as possible")
+    parser.add_argument('--calibrate', action='store_true',
+                        help="Calibrate every lane on its first frame (otherwise saved calibrations are used)")
+    args = parser.parse_args()
+
+    sources = [parse_source(source) for source in args.sources]
+    runner = MultiLaneRunner(sources, use_processes=args.processes, realtime=not args.fast,
+                             calibrate=args.calibrate, workers=args.workers)
+    print(f"Starting {len(sources)} lanes on {runner.worker_count} worker "
+          f"{'processes' if args.processes else 'threads'} ({os.cpu_count()} cores)")
+    runner.start()
+
+    board = None if args.no_display else Scoreboard(runner.lanes)
+    clock = pygame.time.Clock()
+    last_print = time.perf_counter()
+    running = True
+    try:
+        while running:
+            runner.poll()
+            if board is not None:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                        running = False
+                board.draw(runner.lanes)
+            elif time.perf_counter() - last_print >= 1.0:
+                last_print = time.perf_counter()
+                print(runner.report() + "\n")
+            if board is None and runner.all_done():
+                break
+            clock.tick(30)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.stop()
+        runner.poll()
+        print(runner.report())
+        if board is not None:
+            pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
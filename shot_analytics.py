@@ -0,0 +1,202 @@
+import sys
+import numpy as np
+
+from error_categories import ERROR_CATEGORIES, ERROR_CATEGORIES_INFO
+
+# Aim-trace analytics over recorded laser sessions (see ShotStore in laser_track.py).
+# Positions are offsets from the target center in display pixels
+# (TARGET_RADIUS = 200 px for the 155.5 mm ISSF target, about 0.39 mm per px).
+
+# Window before the shot used for hold metrics (seconds)
+HOLD_WINDOW = 0.5
+# Final stretch before the shot used for trigger/recoil movement (seconds)
+FINAL_WINDOW = 0.15
+# Fewer samples than this and a metric is reported as NaN
+MIN_SAMPLES = 3
+
+# Chi-square value for a 95% confidence ellipse with 2 degrees of freedom
+CHI2_95_2DOF = 5.991
+
+# Thresholds at which a metric starts pointing at an error category
+EARLY_RECOIL_DROP_PX = 6.0         # Shot lands this far below the aim point
+TRIGGER_PULL_PX = 6.0              # Shot pushed sideways from the aim point
+FRONTSIGHT_DIP_PX_S = 40.0         # Downward aim velocity in the final window
+BREATH_DRIFT_PX_S = 25.0           # Vertical drift over the whole hold
+GRIP_TREMOR_RMS_PX = 4.0           # Jitter around the hold's own drift line
+STANCE_HOLD_AREA_PX2 = 900.0       # 95% hold ellipse area
+
+
+def load_session(path):
+    """Load (shots, traces) from a file written by ShotStore.export"""
+    data = np.load(path)
+    return data['shots'], data['traces']
+
+
+def _masked_mean(values, mask, counts):
+    return np.where(counts > 0, (values * mask).sum(axis=1) / np.maximum(counts, 1), np.nan)
+
+
+def _window_stats(traces, trace_len, start, end=0.0):
+    """
+    Per-shot statistics of the aim samples with start <= t <= end (t relative
+    to the shot). Returns a dict of 1-D arrays, NaN where too few samples.
+    """
+    n_samples = traces.shape[1]
+    t = traces[:, :, 0].astype(np.float64)
+    x = traces[:, :, 1].astype(np.float64)
+    y = traces[:, :, 2].astype(np.float64)
+    mask = (np.arange(n_samples)[None, :] < trace_len[:, None]) & (t >= start) & (t <= end)
+    counts = mask.sum(axis=1)
+    enough = counts >= MIN_SAMPLES
+
+    mean_t = _masked_mean(t, mask, counts)
+    mean_x = _masked_mean(x, mask, counts)
+    mean_y = _masked_mean(y, mask, counts)
+    dt = np.where(mask, t - mean_t[:, None], 0.0)
+    dx = np.where(mask, x - mean_x[:, None], 0.0)
+    dy = np.where(mask, y - mean_y[:, None], 0.0)
+
+    denom = np.maximum(counts - 1, 1)
+    var_x = (dx * dx).sum(axis=1) / denom
+    var_y = (dy * dy).sum(axis=1) / denom
+    cov_xy = (dx * dy).sum(axis=1) / denom
+
+    # Least-squares drift velocity per axis
+    tt = (dt * dt).sum(axis=1)
+    safe_tt = np.where(tt > 0, tt, 1.0)
+    vel_x = np.where(tt > 0, (dt * dx).sum(axis=1) / safe_tt, 0.0)
+    vel_y = np.where(tt > 0, (dt * dy).sum(axis=1) / safe_tt, 0.0)
+
+    # Residual jitter around the drift line
+    res_x = dx - vel_x[:, None] * dt
+    res_y = dy - vel_y[:, None] * dt
+    tremor = np.sqrt(((res_x * res_x + res_y * res_y) * mask).sum(axis=1) / np.maximum(counts, 1))
+
+    det = np.maximum(var_x * var_y - cov_xy * cov_xy, 0.0)
+    nan = np.full(len(traces), np.nan)
+    return {
+        'samples': counts,
+        'mean_x': np.where(enough, mean_x, nan),
+        'mean_y': np.where(enough, mean_y, nan),
+        'stability_rms': np.where(enough, np.sqrt(var_x + var_y), nan),
+        'hold_area_95': np.where(enough, np.pi * CHI2_95_2DOF * np.sqrt(det), nan),
+        'drift_vx': np.where(enough, vel_x, nan),
+        'drift_vy': np.where(enough, vel_y, nan),
+        'drift_speed': np.where(enough, np.hypot(vel_x, vel_y), nan),
+        'tremor_rms': np.where(enough, tremor, nan)
+    }
+
+
+def shot_metrics(shots, traces, hold_window=HOLD_WINDOW, final_window=FINAL_WINDOW):
+    """Per-shot aim metrics for a whole session, computed in one batched pass"""
+    trace_len = shots['trace_len'].astype(np.int64)
+    hold = _window_stats(traces, trace_len, -hold_window)
+    final = _window_stats(traces, trace_len, -final_window)
+    shot_x = shots['x'].astype(np.float64)
+    shot_y = shots['y'].astype(np.float64)
+    return {
+        'samples': hold['samples'],
+        'stability_rms': hold['stability_rms'],
+        'hold_area_95': hold['hold_area_95'],
+        'drift_speed': hold['drift_speed'],
+        'drift_vy': hold['drift_vy'],
+        'tremor_rms': hold['tremor_rms'],
+        'final_vy': final['drift_vy'],
+        # Where the shot landed relative to where the shooter was aiming (+y is low)
+        'shot_offset_x': shot_x - hold['mean_x'],
+        'shot_offset_y': shot_y - hold['mean_y']
+    }
+
+
+def extreme_spread(x, y, angles=180, chunk=4096):
+    """
+    Group size as the largest distance between any two shots, taken as the
+    widest projection over `angles` directions (within 0.01% for 180).
+    """
+    if len(x) < 2:
+        return 0.0
+    theta = np.linspace(0.0, np.pi, angles, endpoint=False)
+    directions = np.stack([np.cos(theta), np.sin(theta)])
+    points = np.stack([x, y], axis=1)
+    lo = np.full(angles, np.inf)
+    hi = np.full(angles, -np.inf)
+    for start in range(0, len(points), chunk):
+        proj = points[start:start + chunk] @ directions
+        lo = np.minimum(lo, proj.min(axis=0))
+        hi = np.maximum(hi, proj.max(axis=0))
+    return float((hi - lo).max())
+
+
+def category_scores(metrics):
+    """
+    Score each shot against ERROR_CATEGORIES. A score of 1.0 means the
+    metric behind that category has reached its threshold; NaN metrics
+    score 0. Returns an (n_shots, len(ERROR_CATEGORIES)) array.
+    """
+    ratios = {
+        'frontsight_dip': metrics['final_vy'] / FRONTSIGHT_DIP_PX_S,
+        'overtight_grip': metrics['tremor_rms'] / GRIP_TREMOR_RMS_PX,
+        'acute_angle_trigger': np.abs(metrics['shot_offset_x']) / TRIGGER_PULL_PX,
+        'stance_position': metrics['hold_area_95'] / STANCE_HOLD_AREA_PX2,
+        'breath_control': np.abs(metrics['drift_vy']) / BREATH_DRIFT_PX_S,
+        'early_recoil': metrics['shot_offset_y'] / EARLY_RECOIL_DROP_PX
+    }
+    scores = np.stack([ratios[category] for category in ERROR_CATEGORIES], axis=1)
+    return np.nan_to_num(np.maximum(scores, 0.0), nan=0.0)
+
+
+def analyze_session(shots, traces):
+    """Per-shot metrics, flagged categories and a session summary"""
+    metrics = shot_metrics(shots, traces)
+    scores = category_scores(metrics)
+    flagged = np.where(scores.max(axis=1) >= 1.0, scores.argmax(axis=1), -1)
+    counts = np.bincount(flagged[flagged >= 0], minlength=len(ERROR_CATEGORIES))
+
+    x = shots['x'].astype(np.float64)
+    y = shots['y'].astype(np.float64)
+    has_shots = len(shots) > 0
+    has_traces = bool(np.any(metrics['samples'] >= MIN_SAMPLES))
+    summary = {
+        'shots': int(len(shots)),
+        'mean_score': float(shots['score'].mean()) if has_shots else 0.0,
+        'mean_point_of_impact': (float(x.mean()), float(y.mean())) if has_shots else (0.0, 0.0),
+        'group_size': extreme_spread(x, y),
+        'mean_radius': float(np.hypot(x - x.mean(), y - y.mean()).mean()) if has_shots else 0.0,
+        'stability_rms': float(np.nanmean(metrics['stability_rms'])) if has_traces else float('nan'),
+        'hold_area_95': float(np.nanmedian(metrics['hold_area_95'])) if has_traces else float('nan'),
+        'drift_speed': float(np.nanmedian(metrics['drift_speed'])) if has_traces else float('nan'),
+        'category_counts': {category: int(count) for category, count in zip(ERROR_CATEGORIES, counts)},
+        'primary_error': ERROR_CATEGORIES[int(counts.argmax())] if counts.any() else None
+    }
+    return {
+        'metrics': metrics,
+        'scores': scores,
+        'flagged': flagged,
+        'summary': summary
+    }
+
+
+def print_report(summary):
+    """Print a coach-facing summary of analyze_session()"""
+    print(f"Shots: {summary['shots']}  Mean score: {summary['mean_score']:.2f}")
+    mpi_x, mpi_y = summary['mean_point_of_impact']
+    print(f"Mean point of impact: ({mpi_x:+.1f}, {mpi_y:+.1f}) px  Group size: {summary['group_size']:.1f} px  "
+          f"Mean radius: {summary['mean_radius']:.1f} px")
+    print(f"Aim stability (RMS): {summary['stability_rms']:.2f} px  95% hold area: {summary['hold_area_95']:.0f} px^2  "
+          f"Drift: {summary['drift_speed']:.1f} px/s")
+    print("\nShots flagged per error type:")
+    for category, count in summary['category_counts'].items():
+        print(f"{category}: {count}")
+    primary = summary['primary_error']
+    if primary:
+        print(f"\nMost frequent issue: {primary}")
+        print(f"Issue: {ERROR_CATEGORIES_INFO[primary]['description']}")
+        print(f"Solution: {ERROR_CATEGORIES_INFO[primary]['solution']}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python shot_analytics.py <shots.npz>")
+        sys.exit(1)
+    shots, traces = load_session(sys.argv[1])
+    print_report(analyze_session(shots, traces)['summary'])
@@ -1,12 +1,20 @@
+import argparse
+import hashlib
+import os
+import time
+from contextlib import nullcontext
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from torchvision import datasets, transforms, models
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, TensorDataset
 
 # Paths
 data_dir = 'training_data'
+feature_cache_dir = 'feature_cache'
 num_classes = 6  # One for each folder
+# Pretrained backbone weights (what resnet18(pretrained=True) loads); part of the feature cache key
+backbone_weights = 'resnet18.IMAGENET1K_V1'
 
 # Data transforms
 transform = transforms.Compose([
@@ -14,35 +22,192 @@ transform = transforms.Compose([
     transforms.ToTensor(),
 ])
 
-# Dataset and DataLoader
-dataset = datasets.ImageFolder(data_dir, transform=transform)
-dataloader = DataLoader(dataset, batch_size=16, shuffle=True)
-
-# Model (using a pre-trained ResNet18)
-model = models.resnet18(pretrained=True)
-model.fc = nn.Linear(model.fc.in_features, num_classes)
-
-# Training setup
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-model = model.to(device)
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=0.001)
-
-# Training loop
-epochs = 5
-for epoch in range(epochs):
-    model.train()
-    running_loss = 0.0
-    for inputs, labels in dataloader:
-        inputs, labels = inputs.to(device), labels.to(device)
-        optimizer.zero_grad()
-        outputs = model(inputs)
-        loss = criterion(outputs, labels)
-        loss.backward()
-        optimizer.step()
-        running_loss += loss.item()
-    print(f"Epoch {epoch+1}/{epochs}, Loss: {running_loss/len(dataloader)}")
-
-# Save the model
-torch.save(model.state_dict(), 'model.pth')
-print("Model saved as model.pth")
\ No newline at end of file
+
+def default_workers():
+    """Loader processes: leave one core for the training loop itself"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def make_dataloader(dataset, batch_size, shuffle, workers, device):
+    """
+    DataLoader that decodes in `workers` processes which stay alive between
+    epochs, with pinned memory when batches go to a GPU.
+    """
+    options = {}
+    if workers > 0:
+        options = {'persistent_workers': True, 'prefetch_factor': 4}
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=workers,
+                      pin_memory=device.type == 'cuda', **options)
+
+
+def bf16_supported(device):
+    """Whether bf16 autocast runs natively (AVX512-BF16/AMX on CPU, Ampere+ on GPU)"""
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    # Without native support CPU bf16 is emulated and slower than float32.
+    # These probes are private torch API, so missing ones count as unsupported.
+    for probe in ('_is_avx512_bf16_supported', '_is_amx_tile_supported'):
+        supported = getattr(torch.cpu, probe, None)
+        if supported is not None and supported():
+            return True
+    return False
+
+
+def autocast(device, enabled):
+    if not enabled:
+        return nullcontext()
+    return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+
+
+def build_model(channels_last=False):
+    # Model (using a pre-trained ResNet18)
+    model = models.resnet18(pretrained=True)
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def log_epoch(epoch, epochs, loss, images, seconds):
+    print(f"Epoch {epoch+1}/{epochs}, Loss: {loss}, {images / seconds:.1f} images/s ({seconds:.2f}s)")
+
+
+def train_full(model, dataset, device, epochs=5, batch_size=16, lr=0.001, workers=0,
+               channels_last=False, bf16=False):
+    """Fine-tune the whole network, decoding images every epoch"""
+    dataloader = make_dataloader(dataset, batch_size, True, workers, device)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+
+    for epoch in range(epochs):
+        model.train()
+        running_loss = 0.0
+        images = 0
+        start = time.perf_counter()
+        for inputs, labels in dataloader:
+            inputs = inputs.to(device, memory_format=memory_format, non_blocking=True)
+            labels = labels.to(device, non_blocking=True)
+            optimizer.zero_grad()
+            with autocast(device, bf16):
+                outputs = model(inputs)
+                loss = criterion(outputs, labels)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item()
+            images += len(labels)
+        log_epoch(epoch, epochs, running_loss / len(dataloader), images, time.perf_counter() - start)
+
+
+def feature_cache_path(dataset, bf16=False):
+    """
+    Cache file for a dataset's backbone features. The name covers the
+    backbone weights, the precision they were extracted at and every
+    image's path, size and modification time, so changing any of them
+    makes a new cache instead of silently reusing a stale one.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{backbone_weights}|{'bf16' if bf16 else 'fp32'}\n".encode())
+    for path, label in dataset.samples:
+        stat = os.stat(path)
+        digest.update(f"{path}|{label}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return os.path.join(feature_cache_dir, f"resnet18_{digest.hexdigest()[:16]}.pt")
+
+
+def extract_features(model, dataset, device, batch_size=64, workers=0, channels_last=False, bf16=False):
+    """
+    Penultimate-layer features of every image, computed once with the frozen
+    backbone and cached on disk. Returns (features, labels) float32/int64 tensors.
+    """
+    path = feature_cache_path(dataset, bf16)
+    if os.path.exists(path):
+        cached = torch.load(path)
+        print(f"Loaded {len(cached['labels'])} cached features from {path}")
+        return cached['features'], cached['labels']
+
+    fc = model.fc
+    model.fc = nn.Identity()
+    model.eval()
+    dataloader = make_dataloader(dataset, batch_size, False, workers, device)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    features, labels = [], []
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for inputs, batch_labels in dataloader:
+            inputs = inputs.to(device, memory_format=memory_format, non_blocking=True)
+            with autocast(device, bf16):
+                features.append(model(inputs).float().cpu())
+            labels.append(batch_labels)
+    model.fc = fc
+    features = torch.cat(features)
+    labels = torch.cat(labels)
+    seconds = time.perf_counter() - start
+    print(f"Extracted {len(labels)} features in {seconds:.2f}s ({len(labels) / seconds:.1f} images/s)")
+
+    os.makedirs(feature_cache_dir, exist_ok=True)
+    torch.save({'features': features, 'labels': labels, 'classes': dataset.classes}, path)
+    print(f"Cached features to {path}")
+    return features, labels
+
+
+def train_head(model, features, labels, device, epochs=5, batch_size=16, lr=0.001):
+    """Train only the fc head on cached backbone features"""
+    head = model.fc
+    loader = DataLoader(TensorDataset(features, labels), batch_size=batch_size, shuffle=True)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(head.parameters(), lr=lr)
+
+    for epoch in range(epochs):
+        head.train()
+        running_loss = 0.0
+        start = time.perf_counter()
+        for inputs, batch_labels in loader:
+            inputs, batch_labels = inputs.to(device), batch_labels.to(device)
+            optimizer.zero_grad()
+            loss = criterion(head(inputs), batch_labels)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item()
+        log_epoch(epoch, epochs, running_loss / len(loader), len(labels), time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune ResNet18 on the shooting error images")
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--workers', type=int, default=default_workers(), help="DataLoader worker processes")
+    parser.add_argument('--freeze-backbone', action='store_true',
+                        help="Train only the fc head on backbone features cached in " + feature_cache_dir)
+    parser.add_argument('--channels-last', action='store_true', help="Use the channels-last memory format")
+    parser.add_argument('--bf16', choices=['auto', 'on', 'off'], default='off',
+                        help="bf16 autocast (changes numerics, so opt-in); "
+                             "'auto' enables it where the hardware supports it natively")
+    parser.add_argument('--output', default='model.pth')
+    args = parser.parse_args()
+
+    # Dataset
+    dataset = datasets.ImageFolder(data_dir, transform=transform)
+
+    # Training setup
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    bf16 = args.bf16 == 'on' or (args.bf16 == 'auto' and bf16_supported(device))
+    print(f"Training on {device} with {args.workers} loader workers, "
+          f"{'channels-last' if args.channels_last else 'contiguous'} tensors, bf16 {'on' if bf16 else 'off'}")
+    model = build_model(args.channels_last).to(device)
+
+    if args.freeze_backbone:
+        features, labels = extract_features(model, dataset, device, workers=args.workers,
+                                            channels_last=args.channels_last, bf16=bf16)
+        train_head(model, features, labels, device, args.epochs, args.batch_size, args.lr)
+    else:
+        train_full(model, dataset, device, args.epochs, args.batch_size, args.lr, args.workers,
+                   args.channels_last, bf16)
+
+    # Save the model
+    torch.save(model.state_dict(), args.output)
+    print(f"Model saved as {args.output}")
+
+
+if __name__ == "__main__":
+    main()